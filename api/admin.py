@@ -1,3 +1,12 @@
 from django.contrib import admin
 
+from api.models import SerpCacheEntry
+
 # Register your models here.
+
+
+@admin.register(SerpCacheEntry)
+class SerpCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("keyword", "date", "created_at", "hits", "misses")
+    search_fields = ("keyword",)
+    exclude = ("items",)
@@ -0,0 +1,124 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet, Window
+from django.db.models.functions import RowNumber
+
+from api.models import (ArchiveSegment, Difference, PageSnapshot, Result,
+                        Scrape, Status)
+from api.segments import SegmentWriter
+
+BATCH_SIZE = 500
+
+
+def get_archivable_scrape_ids(before: datetime, keep_scrapes: int) -> QuerySet:
+    """
+    Returns the ids of the completed scrapes started before the date, other
+    than the last keep_scrapes scrapes of their query, as a subquery, as they
+    add up to too many to pass as parameters
+    """
+    return (
+        Scrape.objects.exclude(status=Status.PENDING)
+        .annotate(
+            recency=Window(
+                RowNumber(), partition_by=F("query_id"), order_by=F("started_at").desc()
+            )
+        )
+        .filter(recency__gt=keep_scrapes, started_at__lt=before)
+        .values("id")
+    )
+
+
+def archive_rows(queryset: QuerySet, max_segment_bytes: int) -> int:
+    """
+    Moves the archived fields of the rows to archive segments, returning the
+    number of rows archived. Segments are appended to until they reach
+    max_segment_bytes, and are never written to again after.
+    """
+    model = queryset.model
+    fields = model.archived_fields
+    segment = writer = None
+    rows = []
+    count = 0
+
+    def save_rows() -> None:
+        writer.flush()
+        with transaction.atomic():
+            model.objects.bulk_update(
+                rows, ["archive_segment", "archive_offset", "archive_length", *fields]
+            )
+            ArchiveSegment.objects.filter(id=segment.id).update(
+                records=F("records") + len(rows), size=writer.size
+            )
+        rows.clear()
+
+    for row in queryset.only("id", *fields).iterator(chunk_size=BATCH_SIZE):
+        if writer is None or writer.size >= max_segment_bytes:
+            if rows:
+                save_rows()
+            if writer is not None:
+                writer.close()
+            segment = ArchiveSegment.objects.create()
+            writer = SegmentWriter(segment.id)
+
+        row.archive_offset, row.archive_length = writer.append(row.get_archive_record())
+        row.archive_segment = segment
+        for field in fields:
+            setattr(row, field, None)
+        rows.append(row)
+        count += 1
+        if len(rows) == BATCH_SIZE:
+            save_rows()
+
+    if rows:
+        save_rows()
+    if writer is not None:
+        writer.close()
+    return count
+
+
+def archive_old_content(
+    older_than_days: int | None = None, keep_scrapes: int | None = None
+) -> dict:
+    """
+    Archives the content of the differences and page snapshots of the scrapes
+    older than older_than_days, other than the last keep_scrapes scrapes of
+    each query. Snapshots still used by a result of a later scrape are kept.
+    """
+    if older_than_days is None:
+        older_than_days = settings.ARCHIVE_AFTER_DAYS
+    if keep_scrapes is None:
+        keep_scrapes = settings.ARCHIVE_KEEP_SCRAPES
+    before = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    scrape_ids = get_archivable_scrape_ids(before, keep_scrapes)
+
+    differences = Difference.objects.filter(
+        result2__scrape_id__in=scrape_ids, archive_segment__isnull=True
+    ).exclude(
+        # differences recorded lazily whose changes aren't computed yet
+        content_changes__isnull=True,
+        content_difference__isnull=True,
+    )
+    snapshots = (
+        PageSnapshot.objects.filter(
+            result__scrape_id__in=scrape_ids, archive_segment__isnull=True
+        )
+        .exclude(
+            id__in=Result.objects.filter(snapshot__isnull=False)
+            .exclude(scrape_id__in=scrape_ids)
+            .values("snapshot_id")
+        )
+        .distinct()
+    )
+
+    stats = {
+        "scrapes": scrape_ids.count(),
+        "differences": archive_rows(differences, settings.ARCHIVE_SEGMENT_MAX_BYTES),
+        "snapshots": archive_rows(snapshots, settings.ARCHIVE_SEGMENT_MAX_BYTES),
+    }
+    logging.info(
+        f"Archived {stats['differences']} differences and {stats['snapshots']} "
+        f"snapshots of {stats['scrapes']} scrapes"
+    )
+    return stats
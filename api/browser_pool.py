@@ -0,0 +1,132 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+
+from django.conf import settings
+from selenium.webdriver.chrome.options import Options
+from undetected_chromedriver import Chrome
+
+
+def create_chrome_driver() -> Chrome:
+    options = Options()
+    options.add_argument("--start-maximized")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    driver = Chrome(options=options, headless=os.getenv("ENVIRON") == "prod")
+    driver.set_page_load_timeout(30)
+    return driver
+
+
+class BrowserPool:
+    """
+    A pool of long-lived browser drivers that are leased out to scrapes.
+    At most size drivers exist at once. A driver is quit and replaced after it
+    has loaded max_pages pages, or as soon as it stops responding.
+    """
+
+    def __init__(
+        self,
+        driver_factory: Callable = create_chrome_driver,
+        size: int = 2,
+        max_pages: int = 50,
+    ) -> None:
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages = max_pages
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._page_counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def lease(self, timeout: float | None = None) -> Iterator:
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No browser available in the pool.")
+        try:
+            driver = self._get_driver()
+            try:
+                yield driver
+            finally:
+                self._page_counts[id(driver)] += 1
+                self._release_driver(driver)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+    def _get_driver(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        logging.info("Starting a new browser for the pool")
+        driver = self.driver_factory()
+        with self._lock:
+            self._page_counts[id(driver)] = 0
+        return driver
+
+    def _release_driver(self, driver) -> None:
+        if self._closed:
+            self._quit(driver)
+        elif self._page_counts[id(driver)] >= self.max_pages:
+            logging.info("Recycling browser after %d pages", self.max_pages)
+            self._quit(driver)
+        elif not self._is_alive(driver):
+            logging.info("Discarding crashed browser")
+            self._quit(driver)
+        else:
+            self._idle.put(driver)
+
+    def _is_alive(self, driver) -> bool:
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, driver) -> None:
+        with self._lock:
+            self._page_counts.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """
+    Returns the browser pool of the current process, creating it on first use.
+    """
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(
+                size=settings.SCRAPER_BROWSER_POOL_SIZE,
+                max_pages=settings.SCRAPER_BROWSER_MAX_PAGES,
+            )
+        return _browser_pool
+
+
+def close_browser_pool() -> None:
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is not None:
+            _browser_pool.close()
+            _browser_pool = None
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+import django
+from django.conf import settings
+
+
+def init_process() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "serp_checker.settings")
+    django.setup()
+
+
+class ComputePool:
+    """
+    Runs CPU bound work, like extracting text and diffing pages, on a pool
+    of processes so it isn't serialized with the rest of the scrape by the
+    GIL. At most max_pending calls are queued or running at once; submit
+    blocks beyond that, so producers slow down to the pace of the pool.
+    Calls run inline in the calling thread if processes is 0, or if the
+    current process is a daemon, which can't start processes of its own.
+    """
+
+    def __init__(self, processes: int = 0, max_pending: int | None = None) -> None:
+        self.processes = processes
+        self._pending = threading.BoundedSemaphore(max_pending or 2 * max(processes, 1))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def is_inline(self) -> bool:
+        return self.processes == 0 or multiprocessing.current_process().daemon
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if self.is_inline:
+            return self.run_inline(fn, *args)
+
+        self._pending.acquire()
+        try:
+            future = self.get_executor().submit(fn, *args)
+        except BrokenProcessPool as e:
+            self._pending.release()
+            logging.error("Compute pool broken, restarting it: " + str(e))
+            self.close()
+            return self.run_inline(fn, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def run(self, fn: Callable, *args):
+        return self.submit(fn, *args).result()
+
+    def run_inline(self, fn: Callable, *args) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # spawned rather than forked, as forking a process running
+                # threads can copy locks held by the other threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_process,
+                )
+            return self._executor
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_compute_pool = None
+_compute_pool_lock = threading.Lock()
+
+
+def get_compute_pool() -> ComputePool:
+    """
+    Returns the compute pool of the current process, creating it on first use.
+    """
+    global _compute_pool
+    with _compute_pool_lock:
+        if _compute_pool is None:
+            _compute_pool = ComputePool(
+                processes=settings.SCRAPER_COMPUTE_PROCESSES,
+                max_pending=settings.SCRAPER_COMPUTE_MAX_PENDING,
+            )
+        return _compute_pool
+
+
+def close_compute_pool() -> None:
+    global _compute_pool
+    with _compute_pool_lock:
+        if _compute_pool is not None:
+            _compute_pool.close()
+            _compute_pool = None
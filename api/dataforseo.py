@@ -0,0 +1,133 @@
+import logging
+from base64 import b64encode
+from typing import List
+
+from django.conf import settings
+
+from api.http_client import get_http_client
+from api.serp_cache import cache_serp, get_cached_serp
+
+
+class DataForSEOError(Exception):
+    pass
+
+
+class DataForSEOClient:
+    """
+    Client for the Google organic SERP endpoints of the DataForSEO API.
+    Keywords are either fetched one at a time with the live endpoint, or
+    posted in batches as tasks whose results are collected once ready.
+    """
+
+    # max number of tasks accepted by a single task_post request
+    max_tasks_per_post = 100
+
+    def __init__(
+        self,
+        email: str | None = None,
+        password: str | None = None,
+        base_url: str | None = None,
+    ) -> None:
+        self.base_url = (base_url or settings.DFS_API_URL).rstrip("/")
+
+        base64_bytes = b64encode(
+            (
+                "%s:%s"
+                % (email or settings.DFS_EMAIL, password or settings.DFS_PASSWORD)
+            ).encode("ascii")
+        ).decode("ascii")
+
+        self.headers = {
+            "Authorization": f"Basic {base64_bytes}",
+            "Content-Type": "application/json",
+        }
+
+    def get_task_payload(self, keyword: str) -> dict:
+        return {
+            "keyword": keyword,
+            "location_code": 2826,
+            "language_code": "en",
+            "device": "desktop",
+            "os": "windows",
+            "depth": 100,
+        }
+
+    def live(self, keyword: str) -> List[dict]:
+        """
+        Returns the SERP items for the keyword, from the SERP cache if they
+        are cached
+        """
+        task_payload = self.get_task_payload(keyword)
+        items = get_cached_serp(task_payload)
+        if items is not None:
+            return items
+
+        response = self.request(
+            "POST", "/v3/serp/google/organic/live/advanced", json=[task_payload]
+        )
+        try:
+            items = response["tasks"][0]["result"][0]["items"] or []
+        except (KeyError, IndexError, TypeError):
+            raise DataForSEOError(response)
+        cache_serp(task_payload, items)
+        return items
+
+    def post_tasks(self, keywords_by_tag: dict) -> dict:
+        """
+        Posts a task for every keyword, tagged with its key in keywords_by_tag,
+        and returns the ids of the posted tasks by tag
+        """
+        task_ids = {}
+        tags = list(keywords_by_tag)
+        for start in range(0, len(tags), self.max_tasks_per_post):
+            payload = []
+            for tag in tags[start: start + self.max_tasks_per_post]:
+                task = self.get_task_payload(keywords_by_tag[tag])
+                task["tag"] = str(tag)
+                if settings.DFS_PINGBACK_URL:
+                    task["pingback_url"] = settings.DFS_PINGBACK_URL + "?id=$id&tag=$tag"
+                payload.append(task)
+
+            response = self.request(
+                "POST", "/v3/serp/google/organic/task_post", json=payload)
+            for task in response.get("tasks") or []:
+                if task.get("status_code") != 20100:
+                    logging.error(
+                        f"DataForSEO task not created: {task.get('status_message')}")
+                    continue
+                task_ids[task["data"]["tag"]] = task["id"]
+        return task_ids
+
+    def get_ready_tasks(self) -> List[dict]:
+        """
+        Returns the tasks whose results are ready to be collected, each with
+        its id and tag
+        """
+        response = self.request("GET", "/v3/serp/google/organic/tasks_ready")
+        ready_tasks = []
+        for task in response.get("tasks") or []:
+            ready_tasks.extend(task.get("result") or [])
+        return ready_tasks
+
+    def get_task(self, task_id: str) -> List[dict]:
+        """
+        Returns the SERP items of a ready task, and caches them
+        """
+        response = self.request(
+            "GET", f"/v3/serp/google/organic/task_get/advanced/{task_id}")
+        try:
+            task = response["tasks"][0]
+            items = task["result"][0]["items"] or []
+        except (KeyError, IndexError, TypeError):
+            raise DataForSEOError(response)
+        cache_serp(task["data"], items)
+        return items
+
+    def request(self, method: str, path: str, **kwargs) -> dict:
+        response = get_http_client().request(
+            method, self.base_url + path, headers=self.headers, **kwargs
+        )
+        try:
+            return response.json()
+        except ValueError:
+            raise DataForSEOError(response.text)
@@ -0,0 +1,290 @@
+import difflib
+import logging
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+
+# (tag, i1, i2, j1, j2) as returned by difflib.SequenceMatcher.get_opcodes
+Opcode = Tuple[str, int, int, int, int]
+# [i1, i2, j1, j2], the lines i1:i2 of a changed to the lines j1:j2 of b
+Change = List[int]
+
+
+class DiffEngine:
+    """
+    Diffs two lists of lines. compare renders the diff in the format of
+    difflib.Differ, with the "?" intraline hints of replaced lines only if
+    intraline is set.
+    """
+
+    name = ""
+
+    def get_opcodes(self, a: List[str], b: List[str]) -> List[Opcode]:
+        raise NotImplementedError
+
+    def compare(self, a: List[str], b: List[str], intraline: bool = False) -> List[str]:
+        return render_opcodes(a, b, self.get_opcodes(a, b), intraline)
+
+
+def render_opcodes(
+    a: List[str], b: List[str], opcodes: List[Opcode], intraline: bool = False
+) -> List[str]:
+    lines = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            lines.extend("  " + line for line in a[i1:i2])
+        elif tag == "replace" and intraline:
+            # Differ only has to pair up the lines of the replaced block
+            lines.extend(difflib.Differ().compare(a[i1:i2], b[j1:j2]))
+        else:
+            lines.extend("- " + line for line in a[i1:i2])
+            lines.extend("+ " + line for line in b[j1:j2])
+    return lines
+
+
+def get_changes(opcodes: List[Opcode]) -> List[Change]:
+    """
+    Returns the opcodes without the equal ones, which can be told from the
+    gaps between the changes
+    """
+    return [[i1, i2, j1, j2] for tag, i1, i2, j1, j2 in opcodes if tag != "equal"]
+
+
+def get_content_changes(
+    content1: str, content2: str, engine: str | None = None
+) -> List[Change]:
+    """
+    Returns the changes between the lines of two contents
+    """
+    return get_changes(
+        get_diff_engine(engine).get_opcodes(
+            content1.splitlines(), content2.splitlines())
+    )
+
+
+def get_opcodes_from_changes(changes: List[Change], len_a: int, len_b: int) -> List[Opcode]:
+    opcodes = []
+    i = j = 0
+    for i1, i2, j1, j2 in changes:
+        if i < i1:
+            opcodes.append(("equal", i, i1, j, j1))
+        if i1 == i2:
+            opcodes.append(("insert", i1, i2, j1, j2))
+        elif j1 == j2:
+            opcodes.append(("delete", i1, i2, j1, j2))
+        else:
+            opcodes.append(("replace", i1, i2, j1, j2))
+        i, j = i2, j2
+    if i < len_a:
+        opcodes.append(("equal", i, len_a, j, len_b))
+    return opcodes
+
+
+class DifferEngine(DiffEngine):
+    """
+    difflib.Differ, whose running time grows quadratically with the number
+    of lines on pages with many changes
+    """
+
+    name = "differ"
+
+    def get_opcodes(self, a: List[str], b: List[str]) -> List[Opcode]:
+        return difflib.SequenceMatcher(None, a, b).get_opcodes()
+
+    def compare(self, a: List[str], b: List[str], intraline: bool = False) -> List[str]:
+        if intraline:
+            return list(difflib.Differ().compare(a, b))
+        return super().compare(a, b)
+
+
+class PatienceDiffEngine(DiffEngine):
+    """
+    Patience diff: the lines occurring once in both ranges are matched up in
+    order, and the ranges between them are diffed the same way. Ranges with
+    no such lines are diffed with Myers' algorithm, which gives up on ranges
+    differing in more than max_edits lines and treats them as replaced.
+    """
+
+    name = "patience"
+
+    def __init__(self, max_edits: int = 1000) -> None:
+        self.max_edits = max_edits
+
+    def get_opcodes(self, a: List[str], b: List[str]) -> List[Opcode]:
+        # compare lines by id, as hashing a line is the costly part
+        line_ids: Dict[str, int] = {}
+        a = [line_ids.setdefault(line, len(line_ids)) for line in a]
+        b = [line_ids.setdefault(line, len(line_ids)) for line in b]
+
+        matches = []
+        ranges = [(0, len(a), 0, len(b))]
+        while ranges:
+            alo, ahi, blo, bhi = ranges.pop()
+            # common prefix and suffix
+            while alo < ahi and blo < bhi and a[alo] == b[blo]:
+                matches.append((alo, blo))
+                alo += 1
+                blo += 1
+            while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+                ahi -= 1
+                bhi -= 1
+                matches.append((ahi, bhi))
+            if alo == ahi or blo == bhi:
+                continue
+
+            anchors = self.get_unique_matches(a, b, alo, ahi, blo, bhi)
+            if not anchors:
+                matches.extend(self.myers(a, b, alo, ahi, blo, bhi))
+                continue
+            for i, j in anchors:
+                matches.append((i, j))
+                ranges.append((alo, i, blo, j))
+                alo, blo = i + 1, j + 1
+            ranges.append((alo, ahi, blo, bhi))
+
+        matches.sort()
+        return get_opcodes_from_matches(matches, len(a), len(b))
+
+    def get_unique_matches(
+        self, a: List[int], b: List[int], alo: int, ahi: int, blo: int, bhi: int
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the longest increasing sequence of the pairs of lines that
+        occur exactly once in both ranges
+        """
+        counts: Dict[int, List[int]] = {}
+        for i in range(alo, ahi):
+            counts.setdefault(a[i], [0, i, 0, 0])[0] += 1
+        for j in range(blo, bhi):
+            if a_count := counts.get(b[j]):
+                a_count[2] += 1
+                a_count[3] = j
+        pairs = sorted(
+            (i, j) for count_a, i, count_b, j in counts.values()
+            if count_a == 1 and count_b == 1
+        )
+
+        # patience sorting, by the line in b
+        pile_tops: List[int] = []
+        back_pointers: List[int] = []
+        tops_j: List[int] = []
+        for index, (i, j) in enumerate(pairs):
+            pile = bisect_left(tops_j, j)
+            back_pointers.append(pile_tops[pile - 1] if pile else -1)
+            if pile == len(tops_j):
+                pile_tops.append(index)
+                tops_j.append(j)
+            else:
+                pile_tops[pile] = index
+                tops_j[pile] = j
+
+        sequence = []
+        index = pile_tops[-1] if pile_tops else -1
+        while index != -1:
+            sequence.append(pairs[index])
+            index = back_pointers[index]
+        sequence.reverse()
+        return sequence
+
+    def myers(
+        self, a: List[int], b: List[int], alo: int, ahi: int, blo: int, bhi: int
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the matching lines of the ranges, on a shortest edit script
+        """
+        n = ahi - alo
+        m = bhi - blo
+        offset = n + m + 1
+        v = [0] * (2 * offset + 1)
+        trace = []
+        for d in range(min(n + m, self.max_edits) + 1):
+            trace.append(v[offset - d: offset + d + 1])
+            for k in range(-d, d + 1, 2):
+                if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                    x = v[offset + k + 1]
+                else:
+                    x = v[offset + k - 1] + 1
+                y = x - k
+                while x < n and y < m and a[alo + x] == b[blo + y]:
+                    x += 1
+                    y += 1
+                v[offset + k] = x
+                if x >= n and y >= m:
+                    return self.backtrack(trace, d, n, m, alo, blo)
+        # too different to be worth diffing line by line
+        return []
+
+    def backtrack(
+        self, trace: List[List[int]], d: int, n: int, m: int, alo: int, blo: int
+    ) -> List[Tuple[int, int]]:
+        """
+        Walks the edit script back from the end of the ranges, collecting
+        the matching lines on the way
+        """
+        matches = []
+        x, y = n, m
+        # trace[d] holds v before step d, indexed from -d
+        for step in range(d, 0, -1):
+            previous_v = trace[step]
+            k = x - y
+            if k == -step or (
+                k != step and previous_v[k - 1 + step] < previous_v[k + 1 + step]
+            ):
+                previous_k = k + 1
+            else:
+                previous_k = k - 1
+            previous_x = previous_v[previous_k + step]
+            previous_y = previous_x - previous_k
+            while x > previous_x and y > previous_y and x > 0 and y > 0:
+                x -= 1
+                y -= 1
+                matches.append((alo + x, blo + y))
+            x, y = previous_x, previous_y
+        while x > 0 and y > 0:
+            x -= 1
+            y -= 1
+            matches.append((alo + x, blo + y))
+        return matches
+
+
+def get_opcodes_from_matches(
+    matches: List[Tuple[int, int]], len_a: int, len_b: int
+) -> List[Opcode]:
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in matches + [(len_a, len_b)]:
+        if i < match_i and j < match_j:
+            opcodes.append(("replace", i, match_i, j, match_j))
+        elif i < match_i:
+            opcodes.append(("delete", i, match_i, j, j))
+        elif j < match_j:
+            opcodes.append(("insert", i, i, j, match_j))
+        if match_i == len_a and match_j == len_b:
+            break
+        if opcodes and opcodes[-1][0] == "equal":
+            opcodes[-1] = ("equal", opcodes[-1][1], match_i + 1, opcodes[-1][3], match_j + 1)
+        else:
+            opcodes.append(("equal", match_i, match_i + 1, match_j, match_j + 1))
+        i, j = match_i + 1, match_j + 1
+    return opcodes
+
+
+diff_engines: Dict[str, DiffEngine] = {
+    "differ": DifferEngine(),
+    "patience": PatienceDiffEngine(),
+}
+
+
+@lru_cache(maxsize=None)
+def get_diff_engine(name: str | None = None) -> DiffEngine:
+    """
+    Returns the diff engine with the given name, or the one set in settings.
+    Falls back to Differ if there is no such engine.
+    """
+    name = name or settings.SCRAPER_DIFF_ENGINE
+    if name not in diff_engines:
+        logging.warning(f"Diff engine {name} is not available, using Differ")
+        return diff_engines["differ"]
+    return diff_engines[name]
@@ -0,0 +1,171 @@
+import io
+import logging
+from functools import lru_cache
+from typing import Dict
+
+from bs4 import BeautifulSoup, UnicodeDammit
+from django.conf import settings
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+# elements whose text is never shown on the page
+NON_VISIBLE_TAGS = ("script", "style", "noscript", "template", "svg")
+
+
+class TextExtractor:
+    """
+    Extracts the visible text of an html document. encoding is the charset
+    of the document given by its response, if any.
+    """
+
+    name = ""
+
+    def extract(self, content: bytes, encoding: str | None = None) -> str:
+        raise NotImplementedError
+
+
+def get_html_encoding(content: bytes) -> str:
+    """
+    Returns the encoding declared by an html document, or sniffed from its
+    bytes if it declares none
+    """
+    return UnicodeDammit(content, is_html=True).original_encoding or "utf-8"
+
+
+@lru_cache(maxsize=None)
+def get_html_parser(encoding: str):
+    return lxml.html.HTMLParser(encoding=encoding)
+
+
+class LxmlTextExtractor(TextExtractor):
+    name = "lxml"
+
+    def extract(self, content: bytes, encoding: str | None = None) -> str:
+        # libxml2 reads documents declaring no charset as Latin-1
+        encoding = encoding or get_html_encoding(content)
+        try:
+            parser = get_html_parser(encoding)
+        except LookupError:
+            parser = get_html_parser(get_html_encoding(content))
+        try:
+            document = lxml.html.document_fromstring(content, parser=parser)
+        except (etree.ParserError, ValueError):
+            # raised for documents with no elements
+            return ""
+        etree.strip_elements(document, *NON_VISIBLE_TAGS, with_tail=False)
+        return etree.tostring(document, method="text", encoding="unicode")
+
+
+class BeautifulSoupTextExtractor(TextExtractor):
+    name = "bs4"
+
+    def extract(self, content: bytes, encoding: str | None = None) -> str:
+        soup = BeautifulSoup(content, "html.parser", from_encoding=encoding)
+        for element in soup(NON_VISIBLE_TAGS):
+            element.decompose()
+        return soup.text
+
+
+text_extractors: Dict[str, TextExtractor] = {
+    "bs4": BeautifulSoupTextExtractor(),
+}
+if lxml is not None:
+    text_extractors["lxml"] = LxmlTextExtractor()
+
+
+@lru_cache(maxsize=None)
+def get_text_extractor(name: str | None = None) -> TextExtractor:
+    """
+    Returns the extractor with the given name, or the one set in settings.
+    Falls back to BeautifulSoup if the extractor is not available.
+    """
+    name = name or settings.SCRAPER_TEXT_EXTRACTOR
+    if name not in text_extractors:
+        logging.warning(
+            f"Text extractor {name} is not available, using BeautifulSoup")
+        return text_extractors["bs4"]
+    return text_extractors[name]
+
+
+class UnsupportedContent(Exception):
+    pass
+
+
+def get_content_kind(content_type: str, head: bytes) -> str:
+    """
+    Returns "html", "text" or "pdf" for the Content-Type of a response,
+    sniffing the first bytes of the body when the type is missing or generic.
+    """
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in ("", "application/octet-stream"):
+        if head.lstrip().startswith(b"%PDF-"):
+            return "pdf"
+        return "html"
+    if content_type in ("text/html", "application/xhtml+xml"):
+        return "html"
+    if content_type == "text/plain":
+        return "text"
+    if content_type == "application/pdf":
+        return "pdf"
+    raise UnsupportedContent(f"Skipped unsupported content type {content_type}.")
+
+
+def get_charset(content_type: str) -> str | None:
+    """
+    Returns the charset set by a Content-Type header, if any. requests
+    defaults text types with no charset to ISO-8859-1, which isn't to be
+    trusted.
+    """
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return value.strip().strip("\"'") or None
+    return None
+
+
+def decode_text(content: bytes, encoding: str | None = None) -> str:
+    """
+    Decodes a plain text body with its charset, or as UTF-8 if it is valid
+    UTF-8, or else with the encoding sniffed from its bytes
+    """
+    if encoding:
+        try:
+            return content.decode(encoding, errors="replace")
+        except LookupError:
+            pass
+    return UnicodeDammit(content, known_definite_encodings=["utf-8"]).unicode_markup
+
+
+def extract_pdf_text(content: bytes) -> str:
+    if PdfReader is None:
+        raise UnsupportedContent("Skipped PDF, pypdf is not installed.")
+    reader = PdfReader(io.BytesIO(content))
+    return "\n\n".join(page.extract_text() for page in reader.pages)
+
+
+def extract_text(
+    content: bytes,
+    content_type: str,
+    encoding: str | None = None,
+    extractor: str | None = None,
+) -> str:
+    """
+    Returns the text of a response body, using the extractor for its type.
+    encoding is the charset set by the Content-Type of the response, if any.
+    extractor names the html extractor, the one set in settings by default.
+    """
+    kind = get_content_kind(content_type, content[:1024])
+    if kind == "pdf":
+        return extract_pdf_text(content)
+    if kind == "text":
+        return decode_text(content, encoding)
+    return get_text_extractor(extractor).extract(content, encoding)
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Page:
+    """
+    A fetched page. Holds the response validators used to request the page
+    conditionally next time, and not_modified is set when the server
+    answered such a request with 304 Not Modified (content is then empty).
+    """
+
+    def __init__(
+        self,
+        content: str = "",
+        etag: str | None = None,
+        last_modified: str | None = None,
+        not_modified: bool = False,
+    ) -> None:
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+class ConcurrentFetcher:
+    """
+    Fetches a batch of urls in parallel on a thread pool. The number of
+    in-flight requests is bounded globally (max_workers) and per host
+    (per_host), and the whole batch is bounded by a deadline in seconds.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Page],
+        max_workers: int = 16,
+        per_host: int = 2,
+        deadline: float = 600,
+    ) -> None:
+        self.fetch = fetch
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.deadline = deadline
+
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_semaphores_lock = threading.Lock()
+
+    def fetch_all(
+        self,
+        urls: List[str],
+        on_fetched: Optional[Callable[[int, Page | Exception], None]] = None,
+    ) -> List[Page | Exception]:
+        """
+        Returns the fetched page for every url, in the same order as urls.
+        Failed fetches are returned as the raised exception instead.
+        on_fetched is called with the index and page of every url as soon as
+        it is fetched, in the calling thread.
+        """
+        deadline_at = time.monotonic() + self.deadline
+        results: List[Page | Exception] = [
+            DeadlineExceeded("Scrape deadline exceeded.") for _ in urls
+        ]
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {
+            executor.submit(self.fetch_one, url, deadline_at): index
+            for index, url in enumerate(urls)
+        }
+
+        pending = set(futures)
+        try:
+            while pending:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    logging.error(
+                        f"Scrape deadline exceeded with {len(pending)} pages pending"
+                    )
+                    break
+                done, pending = wait(
+                    pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results[futures[future]] = future.result()
+                    except Exception as e:
+                        results[futures[future]] = e
+                    if on_fetched:
+                        on_fetched(futures[future], results[futures[future]])
+        finally:
+            # don't wait on requests still running past the deadline, or once
+            # on_fetched raised
+            executor.shutdown(wait=False, cancel_futures=True)
+        if on_fetched:
+            for future in pending:
+                on_fetched(futures[future], results[futures[future]])
+        return results
+
+    def fetch_one(self, url: str, deadline_at: float) -> Page:
+        semaphore = self.get_host_semaphore(url)
+        if not semaphore.acquire(timeout=max(0, deadline_at - time.monotonic())):
+            raise DeadlineExceeded("Scrape deadline exceeded.")
+        try:
+            if time.monotonic() >= deadline_at:
+                raise DeadlineExceeded("Scrape deadline exceeded.")
+            return self.fetch(url)
+        finally:
+            semaphore.release()
+
+    def get_host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).hostname or ""
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host
+                )
+            return self._host_semaphores[host]
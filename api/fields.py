@@ -0,0 +1,184 @@
+import bz2
+import logging
+import lzma
+import zlib
+from functools import lru_cache
+from typing import Dict
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+
+class Codec:
+    """
+    Compresses the values of compressed text fields. The header of the codec
+    is stored as the first byte of the values it compresses, so values are
+    read with the codec they were written with, whatever the codec set now.
+    """
+
+    name = ""
+    header = b""
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class NoCodec(Codec):
+    name = "none"
+    header = b"\x00"
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    header = b"\x01"
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        return zlib.compress(data, level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class Bz2Codec(Codec):
+    name = "bz2"
+    header = b"\x02"
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        return bz2.compress(data, max(level, 1))
+
+    def decompress(self, data: bytes) -> bytes:
+        return bz2.decompress(data)
+
+
+class LzmaCodec(Codec):
+    name = "lzma"
+    header = b"\x03"
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        return lzma.compress(data, preset=level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+
+codecs: Dict[str, Codec] = {
+    codec.name: codec for codec in (NoCodec(), ZlibCodec(), Bz2Codec(), LzmaCodec())
+}
+codecs_by_header: Dict[bytes, Codec] = {codec.header: codec for codec in codecs.values()}
+
+
+@lru_cache(maxsize=None)
+def get_codec(name: str) -> Codec:
+    """
+    Returns the codec with the given name. Falls back to zlib if there is no
+    such codec.
+    """
+    if name not in codecs:
+        logging.warning(f"Compression codec {name} is not available, using zlib")
+        return codecs["zlib"]
+    return codecs[name]
+
+
+def compress_text(text: str, codec: str | None = None, level: int | None = None) -> bytes:
+    """
+    Returns the text compressed with the codec and level given, or those set
+    in settings. Text that doesn't get smaller is stored as is.
+    """
+    data = text.encode("utf-8")
+    compressor = get_codec(codec or settings.COMPRESSED_FIELD_CODEC)
+    compressed = compressor.compress(
+        data, settings.COMPRESSED_FIELD_LEVEL if level is None else level
+    )
+    if len(compressed) >= len(data):
+        compressor = codecs["none"]
+        compressed = data
+    return compressor.header + compressed
+
+
+def decompress_text(value: bytes) -> str:
+    value = bytes(value)
+    return codecs_by_header[value[:1]].decompress(value[1:]).decode("utf-8")
+
+
+class CompressedText(bytes):
+    """
+    A compressed value as read from the database, decompressed on first
+    access of the field
+    """
+
+
+class CompressedAttribute(DeferredAttribute):
+    # a data descriptor, so it is used even once the value is loaded
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedText):
+            value = decompress_text(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+
+class CompressedTextField(models.TextField):
+    """
+    A text field stored compressed in a binary column. Values are compressed
+    on save and decompressed when the field is first accessed, so rows read
+    without accessing the field, or saved again unchanged, cost no
+    decompression. The codec and level default to those set in settings.
+    """
+
+    descriptor_class = CompressedAttribute
+
+    def __init__(self, *args, codec: str | None = None, level: int | None = None, **kwargs):
+        self.codec = codec
+        self.level = level
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.codec is not None:
+            kwargs["codec"] = self.codec
+        if self.level is not None:
+            kwargs["level"] = self.level
+        return name, path, args, kwargs
+
+    def get_internal_type(self) -> str:
+        return "BinaryField"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return CompressedText(value)
+
+    def to_python(self, value):
+        if isinstance(value, CompressedText):
+            return decompress_text(value)
+        return super().to_python(value)
+
+    def pre_save(self, model_instance, add):
+        # values not accessed since read are saved as they are
+        return model_instance.__dict__[self.attname]
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, CompressedText):
+            return value
+        return compress_text(super().get_prep_value(value), self.codec, self.level)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
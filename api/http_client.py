@@ -0,0 +1,165 @@
+import threading
+from typing import Dict
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def read_body(response: requests.Response, max_bytes: int) -> bytes:
+    """
+    Reads a streamed response body, giving up as soon as it is larger than
+    max_bytes.
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ResponseTooLarge(
+            f"Skipped page of {content_length} bytes, larger than {max_bytes} bytes."
+        )
+
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            raise ResponseTooLarge(
+                f"Skipped page larger than {max_bytes} bytes.")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class ConnectionStats:
+    """
+    Counts requests sent and connections opened per host. Every request that
+    did not open a connection reused a kept-alive one.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, int]] = {}
+
+    def request_sent(self, host: str) -> None:
+        self._increment(host, "requests")
+
+    def connection_opened(self, host: str) -> None:
+        self._increment(host, "connections")
+
+    def _increment(self, host: str, counter: str) -> None:
+        with self._lock:
+            host_stats = self._hosts.setdefault(
+                host, {"requests": 0, "connections": 0})
+            host_stats[counter] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            hosts = {
+                host: {
+                    **host_stats,
+                    "reused": max(0, host_stats["requests"] - host_stats["connections"]),
+                }
+                for host, host_stats in self._hosts.items()
+            }
+        total_requests = sum(stats["requests"] for stats in hosts.values())
+        total_connections = sum(stats["connections"] for stats in hosts.values())
+        return {
+            "requests": total_requests,
+            "connections": total_connections,
+            "reused": max(0, total_requests - total_connections),
+            "hosts": hosts,
+        }
+
+
+connection_stats = ConnectionStats()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        connection_stats.connection_opened(self.host)
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        connection_stats.connection_opened(self.host)
+        return super()._new_conn()
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        connection_stats.request_sent(urlparse(request.url).hostname or "")
+        return super().send(request, *args, **kwargs)
+
+
+class HttpClient:
+    """
+    A requests session whose connections are kept alive and pooled, so
+    requests to the same host reuse connections instead of doing a new
+    TCP and TLS handshake each time. Hosts in host_pool_sizes get a pool of
+    their own with the given size.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        host_pool_sizes: Dict[str, int] | None = None,
+    ) -> None:
+        self.session = requests.Session()
+
+        adapter = CountingHTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        for host, size in (host_pool_sizes or {}).items():
+            adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self.session.mount(f"http://{host}/", adapter)
+            self.session.mount(f"https://{host}/", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_stats(self) -> dict:
+        return connection_stats.get_stats()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    Returns the http client of the current process, creating it on first use.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                host_pool_sizes=settings.HTTP_HOST_POOL_SIZES,
+            )
+        return _http_client
@@ -0,0 +1,87 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+import redis
+from django.conf import settings
+
+_redis_client = None
+_redis_client_lock = threading.Lock()
+
+
+def get_redis_client() -> redis.Redis:
+    global _redis_client
+    with _redis_client_lock:
+        if _redis_client is None:
+            _redis_client = redis.Redis.from_url(settings.SCRAPE_LOCK_REDIS_URL)
+        return _redis_client
+
+
+class QueryLock:
+    """
+    A lease on a query, held in Redis by the scrape of the query in flight.
+    The lease stores the id of that scrape, and expires after ttl seconds
+    unless renewed by heartbeats, so a crashed worker can't hold it forever.
+    """
+
+    def __init__(
+        self, query_id: int, client: redis.Redis | None = None, ttl: int | None = None
+    ) -> None:
+        self.key = f"scrape-lock:query:{query_id}"
+        self.client = client or get_redis_client()
+        self.ttl = ttl or settings.SCRAPE_LOCK_TTL_SECONDS
+
+    def acquire(self, scrape_id: int, ttl: int | None = None) -> bool:
+        return bool(
+            self.client.set(self.key, scrape_id, nx=True, ex=ttl or self.ttl))
+
+    def get_scrape_id(self) -> int | None:
+        scrape_id = self.client.get(self.key)
+        return int(scrape_id) if scrape_id is not None else None
+
+    def heartbeat(self, scrape_id: int) -> bool:
+        """
+        Renews the lease if the scrape still holds it
+        """
+        return self._if_held(scrape_id, lambda pipe: pipe.expire(self.key, self.ttl))
+
+    def release(self, scrape_id: int) -> bool:
+        return self._if_held(scrape_id, lambda pipe: pipe.delete(self.key))
+
+    def _if_held(self, scrape_id: int, command) -> bool:
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                if pipe.get(self.key) != str(scrape_id).encode():
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                command(pipe)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                # the lease changed hands in the meantime
+                return False
+
+
+@contextmanager
+def heartbeat(lock: QueryLock, scrape_id: int) -> Iterator[None]:
+    """
+    Renews the lease of the scrape in the background while the block runs
+    """
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(lock.ttl / 3):
+            try:
+                lock.heartbeat(scrape_id)
+            except redis.RedisError as e:
+                logging.error("Error renewing scrape lock: " + str(e))
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
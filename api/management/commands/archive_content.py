@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_old_content
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the content of the differences and page snapshots of old scrapes "
+        "to archive segments, as the daily task does"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int, default=settings.ARCHIVE_AFTER_DAYS
+        )
+        parser.add_argument(
+            "--keep-scrapes",
+            type=int,
+            default=settings.ARCHIVE_KEEP_SCRAPES,
+            help="Number of latest scrapes of each query to keep the content of",
+        )
+
+    def handle(self, *args, **options):
+        stats = archive_old_content(options["older_than_days"], options["keep_scrapes"])
+        self.stdout.write(
+            f"Archived {stats['differences']} differences and {stats['snapshots']} "
+            f"snapshots of {stats['scrapes']} scrapes"
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Query
+from api.query_urls import backfill_query_urls
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the pages seen by each query from the results of its scrapes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--query-id",
+            type=int,
+            action="append",
+            help="Only backfill the given queries",
+        )
+
+    def handle(self, *args, **options):
+        queries = Query.objects.order_by("id")
+        if options["query_id"]:
+            queries = queries.filter(id__in=options["query_id"])
+
+        for query in queries.iterator():
+            count = backfill_query_urls(query)
+            self.stdout.write(f"{query.query}: {count} pages")
@@ -0,0 +1,126 @@
+import json
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg
+from django.db.models.functions import Length
+from django.test import override_settings
+
+from api.diff import get_diff_engine
+from api.extraction import text_extractors
+from api.management.commands.benchmark_diff import (FIXTURES_DIR,
+                                                    edit_page_lines,
+                                                    get_page_lines)
+from api.models import Difference, Query, Result, Scrape, Status
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the row size and read latency of differences stored with each "
+        "codec and level of the compressed text fields. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200)
+        parser.add_argument("--lines", type=int, default=500)
+        parser.add_argument(
+            "--codecs",
+            default="none,zlib,bz2,lzma",
+            help="Comma separated codecs to compare",
+        )
+        parser.add_argument(
+            "--levels", default="1,6,9", help="Comma separated levels to compare"
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        payloads = self.get_payloads(options)
+        self.stdout.write(
+            f"{options['rows']} differences of "
+            f"{sum(len(payload.encode('utf-8')) for payload in payloads) // len(payloads)} "
+            "bytes of Differ lines on average"
+        )
+
+        with transaction.atomic():
+            query = Query.objects.create(
+                query="benchmark compressed fields", interval_no_of_months=1)
+            scrape = Scrape.objects.create(query=query, status=Status.SUCCESS)
+            result = Result.objects.create(
+                scrape=scrape,
+                page_title="A page",
+                page_link="https://example.com/page",
+                page_ranking=1,
+                page_scrape_status=Status.SUCCESS,
+            )
+
+            for codec in options["codecs"].split(","):
+                levels = [0] if codec == "none" else options["levels"].split(",")
+                for level in [int(level) for level in levels]:
+                    with override_settings(
+                        COMPRESSED_FIELD_CODEC=codec, COMPRESSED_FIELD_LEVEL=level
+                    ):
+                        self.run_codec(f"{codec} {level}", result, payloads, options)
+            transaction.set_rollback(True)
+
+    def get_payloads(self, options) -> list:
+        """
+        Returns the legacy content differences of pages edited from the
+        html fixtures, as stored before content changes
+        """
+        rng = random.Random(options["seed"])
+        extractor = text_extractors["bs4"]
+        corpus = "\n".join(
+            extractor.extract(path.read_bytes()) for path in sorted(FIXTURES_DIR.glob("*.html"))
+        )
+        corpus_lines = re.sub(r"\n{2,}", "\n\n", corpus.strip()).splitlines()
+        engine = get_diff_engine("patience")
+        payloads = []
+        for _ in range(min(options["rows"], 20)):
+            before = get_page_lines(corpus_lines, options["lines"])
+            after = edit_page_lines(before, 0.05, rng)
+            payloads.append(json.dumps(engine.compare(before, after)))
+        return [payloads[index % len(payloads)] for index in range(options["rows"])]
+
+    def run_codec(self, label: str, result: Result, payloads: list, options) -> None:
+        Difference.objects.filter(result1=result).delete()
+        start = time.perf_counter()
+        Difference.objects.bulk_create(
+            Difference(
+                result1=result,
+                result2=result,
+                content_difference=payload,
+                title_difference=json.dumps(["  A page"]),
+                ranking_difference=0,
+                has_difference=True,
+            )
+            for payload in payloads
+        )
+        write_time = time.perf_counter() - start
+        differences = Difference.objects.filter(result1=result)
+        row_size = differences.aggregate(size=Avg(Length("content_difference")))["size"]
+
+        def read_content():
+            for difference in differences.all():
+                difference.content_difference
+
+        def read_rows():
+            list(differences.all())
+
+        def read_metadata():
+            list(differences.only("id", "ranking_difference", "has_difference"))
+
+        timings = []
+        for read in (read_content, read_rows, read_metadata):
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                read()
+            timings.append((time.perf_counter() - start) / options["repeat"] * 1000)
+        self.stdout.write(
+            f"  {label:>8}: {row_size:10.0f} bytes per row, write {write_time * 1000:8.2f} ms, "
+            f"read content {timings[0]:8.2f} ms, rows {timings[1]:8.2f} ms, "
+            f"metadata {timings[2]:8.2f} ms"
+        )
@@ -0,0 +1,115 @@
+import difflib
+import random
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from api.diff import diff_engines
+from api.extraction import text_extractors
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent.parent / "fixtures" / "html"
+
+
+def get_page_lines(corpus_lines: list, size: int) -> list:
+    """
+    Returns a page of size lines made of sections of the corpus, which
+    repeat much of their text the way listings and boilerplate do
+    """
+    lines = []
+    section = 0
+    while len(lines) < size:
+        section += 1
+        lines.append(f"Section {section}")
+        lines.extend(corpus_lines)
+    return lines[:size]
+
+
+def edit_page_lines(lines: list, change_rate: float, rng: random.Random) -> list:
+    """
+    Returns the lines as the page could read in a later scrape: some lines
+    reworded, removed or added, and a block of lines moved
+    """
+    edited = []
+    for index, line in enumerate(lines):
+        roll = rng.random()
+        if roll < change_rate / 3:
+            words = line.split() or [""]
+            words[rng.randrange(len(words))] = "updated"
+            edited.append(" ".join(words))
+        elif roll < change_rate * 2 / 3:
+            continue
+        elif roll < change_rate:
+            edited.append(line)
+            edited.append(f"Added paragraph {index} about the latest changes.")
+        else:
+            edited.append(line)
+
+    start = rng.randrange(len(edited))
+    block = edited[start: start + 20]
+    del edited[start: start + 20]
+    at = rng.randrange(len(edited) + 1)
+    edited[at:at] = block
+    return edited
+
+
+class Command(BaseCommand):
+    help = "Compares the diff engines against difflib.Differ on before/after page pairs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="500,2000,8000",
+            help="Comma separated numbers of lines of the pages",
+        )
+        parser.add_argument(
+            "--change-rates",
+            default="0.01,0.1",
+            help="Comma separated share of the lines changed between the pages",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        extractor = text_extractors["bs4"]
+        corpus = "\n".join(
+            extractor.extract(path.read_bytes()) for path in sorted(FIXTURES_DIR.glob("*.html"))
+        )
+        corpus_lines = re.sub(r"\n{2,}", "\n\n", corpus.strip()).splitlines()
+        rng = random.Random(options["seed"])
+
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            for change_rate in [float(rate) for rate in options["change_rates"].split(",")]:
+                before = get_page_lines(corpus_lines, size)
+                after = edit_page_lines(before, change_rate, rng)
+                self.stdout.write(
+                    f"{size} lines, {change_rate:.0%} changed:")
+
+                start = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    expected = list(difflib.Differ().compare(before, after))
+                differ_time = (time.perf_counter() - start) / options["repeat"]
+                self.stdout.write(
+                    f"  {'Differ':>20} {differ_time * 1000:10.2f} ms, "
+                    f"{sum(line[0] in '+-' for line in expected)} changed lines"
+                )
+
+                for name, engine in diff_engines.items():
+                    for intraline in (False, True):
+                        start = time.perf_counter()
+                        for _ in range(options["repeat"]):
+                            lines = engine.compare(before, after, intraline)
+                        engine_time = (time.perf_counter() - start) / options["repeat"]
+                        # the diff must rebuild both pages, as Differ's does
+                        restores = (
+                            list(difflib.restore(lines, 1)) == before
+                            and list(difflib.restore(lines, 2)) == after
+                        )
+                        label = f"{name}{' intraline' if intraline else ''}"
+                        self.stdout.write(
+                            f"  {label:>20} {engine_time * 1000:10.2f} ms, "
+                            f"{sum(line[0] in '+-' for line in lines)} changed lines, "
+                            f"speedup {differ_time / engine_time:7.2f}x, "
+                            f"restores both pages {restores}"
+                        )
@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from api.extraction import text_extractors
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent.parent / "fixtures" / "html"
+
+
+class Command(BaseCommand):
+    help = "Compares the speed and peak memory of the text extractors over a corpus of html pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--corpus",
+            default=str(FIXTURES_DIR),
+            help="Directory of saved .html pages",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Number of passes over the corpus",
+        )
+
+    def handle(self, *args, **options):
+        pages = [path.read_bytes()
+                 for path in sorted(Path(options["corpus"]).glob("*.html"))]
+        if not pages:
+            self.stderr.write(f"No .html pages found in {options['corpus']}")
+            return
+
+        self.stdout.write(
+            f"{len(pages)} pages, {sum(len(page) for page in pages)} bytes, "
+            f"{options['repeat']} passes"
+        )
+        for name, extractor in text_extractors.items():
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                for page in pages:
+                    extractor.extract(page)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            for page in pages:
+                extractor.extract(page)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{name:>6}: {len(pages) * options['repeat'] / elapsed:10.1f} pages/sec, "
+                f"peak python memory {peak / 1024:10.1f} KiB"
+            )
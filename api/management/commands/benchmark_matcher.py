@@ -0,0 +1,77 @@
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from api.extraction import text_extractors
+from api.matcher import QueryMatcher
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent.parent / "fixtures" / "html"
+
+
+def match_per_page(query: str, text: str):
+    """
+    The relevance check and search_text as they were done before QueryMatcher
+    """
+    query_lowered = query.lower()
+    if all([word not in text.lower() for word in query_lowered.split()]):
+        return False, ""
+    pattern = r"\b(" + "|".join(re.escape(word)
+                                for word in query_lowered.split()) + r")\b"
+    sections = []
+    last_end_index = 0
+    end_index = None
+    for match in re.finditer(pattern, text.lower()):
+        start_index = max(last_end_index, match.start() - 300)
+        if start_index != last_end_index:
+            sections.append("...\n\n")
+        end_index = min(len(text), match.end() + 300)
+        sections.append(text[start_index:end_index])
+        last_end_index = end_index
+    if end_index != len(text):
+        sections.append("...")
+    return True, "".join(sections)
+
+
+class Command(BaseCommand):
+    help = "Compares the compiled query matcher against matching each page from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--query", default="python performance guide")
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=1024 * 1024,
+            help="Size of the page text in characters",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        extractor = text_extractors["bs4"]
+        corpus = "\n".join(
+            extractor.extract(path.read_bytes()) for path in sorted(FIXTURES_DIR.glob("*.html"))
+        )
+        text = (corpus * (options["page_size"] // len(corpus) + 1))[: options["page_size"]]
+        # a page with the query words only near its end
+        sparse_text = re.sub(r"(?i)python|performance|guide", "xxxxxx", text[:-1000]) + text[-1000:]
+        query = options["query"]
+
+        for name, page in (("dense", text), ("sparse", sparse_text)):
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                expected = match_per_page(query, page)
+            per_page_time = (time.perf_counter() - start) / options["repeat"]
+
+            start = time.perf_counter()
+            matcher = QueryMatcher(query)
+            for _ in range(options["repeat"]):
+                result = matcher.match(page)
+            matcher_time = (time.perf_counter() - start) / options["repeat"]
+
+            self.stdout.write(
+                f"{name:>6} page of {len(page)} chars: per page {per_page_time * 1000:8.2f} ms, "
+                f"matcher {matcher_time * 1000:8.2f} ms, "
+                f"speedup {per_page_time / matcher_time:5.2f}x, "
+                f"same output {result == expected}"
+            )
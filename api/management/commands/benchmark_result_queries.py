@@ -0,0 +1,169 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import setup_databases, teardown_databases
+
+from api.models import (Difference, PageSnapshot, Query, Result, Scrape,
+                        Status, hash_url)
+from api.query_urls import backfill_query_urls, get_new_results
+
+BENCHMARK_QUERY = "benchmark result queries"
+
+# indexes added for the lookups, dropped to compare against the plans without them
+LOOKUP_INDEXES = (
+    "result_scrape_link_idx",
+    "result_scrape_status_idx",
+    "difference_changed_idx",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills a test database with a query of many results, and compares the "
+        "plans and timings of the hot result lookups with and without their indexes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--results", type=int, default=1_000_000)
+        parser.add_argument("--results-per-scrape", type=int, default=100)
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=1000,
+            help="Number of distinct pages the results are spread over",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the test database and its fixture for later runs",
+        )
+
+    def handle(self, *args, **options):
+        # the lookup indexes are dropped for a while, locking the tables, so
+        # this runs on a test database rather than the one the app uses
+        old_config = setup_databases(
+            options["verbosity"], interactive=False, keepdb=options["keep"])
+        try:
+            self.run_benchmark(options)
+        finally:
+            teardown_databases(
+                old_config, options["verbosity"], keepdb=options["keep"])
+
+    def run_benchmark(self, options) -> None:
+        query = Query.objects.filter(query=BENCHMARK_QUERY).first()
+        if query is None:
+            query = self.create_fixture(options)
+        scrape1, scrape2 = Scrape.objects.filter(query=query).order_by("-id")[:2][::-1]
+        page_link = Result.objects.filter(scrape=scrape2).values_list(
+            "page_link", flat=True).first()
+        self.stdout.write(
+            f"{Result.objects.filter(scrape__query=query).count()} results in "
+            f"{Scrape.objects.filter(query=query).count()} scrapes"
+        )
+
+        lookups = {
+            "result by page link": (
+                lambda: Result.objects.filter(scrape=scrape2, page_link=page_link),
+                lambda: Result.objects.filter(
+                    scrape=scrape2, page_link_hash=hash_url(page_link)),
+            ),
+            "new results of the scrape": (
+                # the pages of the scrape in none of the results of the other
+                # scrapes, as found before QueryUrl
+                lambda: Result.objects.filter(
+                    scrape=scrape2, page_scrape_status=Status.SUCCESS
+                ).exclude(
+                    page_link__in=Result.objects.filter(
+                        scrape__query=query, page_scrape_status=Status.SUCCESS
+                    ).exclude(scrape=scrape2).values("page_link")
+                ).values_list("page_title", "page_link"),
+                # the pages first seen in the scrape, as found since QueryUrl
+                lambda: get_new_results(scrape2).values_list(
+                    "page_title", "page_link"),
+            ),
+            "differences with changes": (
+                lambda: Difference.objects.filter(
+                    result1__scrape=scrape1, result2__scrape=scrape2, has_difference=True
+                ),
+                lambda: Difference.objects.filter(
+                    result1__scrape=scrape1, result2__scrape=scrape2, has_difference=True
+                )
+                .select_related("result2")
+                .only("id", "result2__page_link", "result2__page_title"),
+            ),
+        }
+
+        with transaction.atomic():
+            self.stdout.write("\n=== Before: former queries, without the lookup indexes")
+            with connection.cursor() as cursor:
+                for name in LOOKUP_INDEXES:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+            for name, (before, _) in lookups.items():
+                self.run_lookup(name, before, options["repeat"])
+            # restore the indexes
+            transaction.set_rollback(True)
+
+        self.stdout.write("\n=== After: rewritten queries, with the lookup indexes")
+        for name, (_, after) in lookups.items():
+            self.run_lookup(name, after, options["repeat"])
+
+    def run_lookup(self, name: str, get_queryset, repeat: int) -> None:
+        self.stdout.write(f"\n{name}:")
+        self.stdout.write(get_queryset().explain())
+        start = time.perf_counter()
+        for _ in range(repeat):
+            rows = list(get_queryset())
+            if rows and isinstance(rows[0], Difference):
+                # read as by get_results_with_difference
+                [(row.result2.page_link, row.result2.page_title) for row in rows]
+        elapsed = (time.perf_counter() - start) / repeat
+        self.stdout.write(f"{len(rows)} rows in {elapsed * 1000:.2f} ms")
+
+    def create_fixture(self, options) -> Query:
+        self.stdout.write(f"Creating {options['results']} results...")
+        rng = random.Random(0)
+        query = Query.objects.create(query=BENCHMARK_QUERY, interval_no_of_months=1)
+        page_links = [f"https://example{index}.com/page" for index in range(options["pages"])]
+        snapshot = PageSnapshot.from_text("Some page content about the query.\n" * 20)
+        PageSnapshot.save_all([snapshot])
+
+        scrapes_count = max(2, options["results"] // options["results_per_scrape"])
+        previous_results = []
+        for _ in range(scrapes_count):
+            scrape = Scrape.objects.create(query=query, status=Status.SUCCESS)
+            results = [
+                Result(
+                    scrape=scrape,
+                    page_title="A page",
+                    page_link=page_link,
+                    page_link_hash=hash_url(page_link),
+                    page_ranking=ranking,
+                    snapshot=snapshot,
+                    page_scrape_status=(
+                        Status.SUCCESS if rng.random() < 0.9 else Status.FAILED),
+                )
+                for ranking, page_link in enumerate(
+                    rng.sample(page_links, options["results_per_scrape"]), 1
+                )
+            ]
+            Result.objects.bulk_create(results)
+
+            previous_by_link = {result.page_link: result for result in previous_results}
+            Difference.objects.bulk_create(
+                Difference(
+                    result1=previous_by_link[result.page_link],
+                    result2=result,
+                    content_changes=[],
+                    title_difference="[]",
+                    ranking_difference=0,
+                    has_difference=rng.random() < 0.1,
+                )
+                for result in results
+                if result.page_link in previous_by_link
+            )
+            previous_results = results
+        backfill_query_urls(query)
+        return query
@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import QuerySet
+
+from api.models import Query
+
+
+def get_due_queries_by_month(queries: QuerySet, now: datetime) -> list:
+    """
+    How due queries were selected before next_run_at, loading every query
+    """
+    due_queries = []
+    for query in queries:
+        num_months = (now.year - query.created_at.year) * 12 + (
+            now.month - query.created_at.month
+        )
+        if num_months % query.interval_no_of_months == 0:
+            due_queries.append(query)
+    return due_queries
+
+
+def get_next_run_at(created_at: datetime, interval: int, now: datetime) -> datetime:
+    """
+    Returns the first of the first month from this one the query is due in,
+    by the monthly schedule, as migration 0016 schedules queries. Queries due
+    this month are due now, as their run of the month hasn't happened yet.
+    """
+    year, month = now.year, now.month
+    while True:
+        if month > 12:
+            year, month = year + 1, 1
+        num_months = (year - created_at.year) * 12 + (month - created_at.month)
+        if num_months % interval == 0:
+            return datetime(year, month, 1, tzinfo=timezone.utc)
+        month += 1
+
+
+class Command(BaseCommand):
+    help = "Times selecting due queries among synthetic queries, by month arithmetic and by next_run_at"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        now = datetime.now(timezone.utc)
+        random.seed(0)
+
+        # everything is rolled back at the end
+        with transaction.atomic():
+            queries = []
+            created_ats = []
+            for index in range(options["queries"]):
+                created_at = now - timedelta(days=random.randint(0, 3 * 365))
+                interval = random.randint(1, 12)
+                queries.append(
+                    Query(
+                        query=f"benchmark query {index}",
+                        interval_no_of_months=interval,
+                        next_run_at=get_next_run_at(created_at, interval, now),
+                    )
+                )
+                created_ats.append(created_at)
+            start = time.perf_counter()
+            Query.objects.bulk_create(queries, batch_size=5000)
+            # created_at is set to now on insert
+            for query, created_at in zip(queries, created_ats):
+                query.created_at = created_at
+            Query.objects.bulk_update(queries, ["created_at"], batch_size=5000)
+            self.stdout.write(
+                f"Created {len(queries)} queries in {time.perf_counter() - start:.2f} s"
+            )
+
+            start = time.perf_counter()
+            # only the synthetic queries, whose schedules agree
+            benchmark_queries = Query.objects.filter(query__startswith="benchmark query ")
+            due_by_month = get_due_queries_by_month(benchmark_queries, now)
+            by_month_time = time.perf_counter() - start
+
+            due_queries = benchmark_queries.filter(next_run_at__lte=now)
+            start = time.perf_counter()
+            due_by_next_run_at = list(due_queries)
+            by_next_run_at_time = time.perf_counter() - start
+
+            self.stdout.write(
+                f"Month arithmetic: {len(due_by_month)} due in {by_month_time * 1000:.1f} ms"
+            )
+            self.stdout.write(
+                f"next_run_at:      {len(due_by_next_run_at)} due in "
+                f"{by_next_run_at_time * 1000:.1f} ms"
+            )
+
+            sql, params = due_queries.query.sql_with_params()
+            with connection.cursor() as cursor:
+                explain = (
+                    "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+                )
+                cursor.execute(explain + sql, params)
+                self.stdout.write("Query plan:")
+                for row in cursor.fetchall():
+                    self.stdout.write(f"  {row[-1]}")
+
+            transaction.set_rollback(True)
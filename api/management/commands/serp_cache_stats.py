@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.serp_cache import get_serp_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Prints the hit and miss counts of the SERP cache"
+
+    def handle(self, *args, **options):
+        stats = get_serp_cache_stats()
+        self.stdout.write(
+            f"{stats['entries']} entries, {stats['hits']} hits, "
+            f"{stats['misses']} misses, hit rate {stats['hit_rate']:.1%}"
+        )
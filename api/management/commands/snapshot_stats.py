@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.snapshots import get_orphan_snapshots, get_snapshot_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the space the page snapshots save over storing the page text "
+        "of each result, and optionally deletes the snapshots no result refers to"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prune", action="store_true", help="Delete the orphan snapshots"
+        )
+
+    def handle(self, *args, **options):
+        stats = get_snapshot_stats()
+        self.stdout.write(
+            f"{stats['results']} results share {stats['snapshots']} snapshots "
+            f"({stats['orphans']} orphans, {stats['archived']} archived)\n"
+            f"page text of the results: {stats['text_bytes']} bytes, "
+            f"{stats['in_database_text_bytes']} bytes of snapshots in the database\n"
+            f"distinct page text: {stats['snapshot_text_bytes']} bytes\n"
+            f"stored compressed in the database: {stats['stored_bytes']} bytes, "
+            f"{stats['saved_ratio']:.1%} saved\n"
+            f"archived: {stats['archived_bytes']} bytes"
+        )
+        if options["prune"]:
+            deleted, _ = get_orphan_snapshots().delete()
+            self.stdout.write(f"Deleted {deleted} orphan snapshots")
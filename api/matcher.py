@@ -0,0 +1,96 @@
+import re
+from functools import lru_cache
+from typing import List, Tuple
+
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class QueryMatcher:
+    """
+    Matches the words of a query in page text, ignoring case. A page is
+    relevant if any query word appears in it, even inside another word, and
+    its sections are the text within window characters of every match of a
+    whole query word.
+
+    The text is lowercased once and every word is located with str.find, so
+    both are found in a single scan per word at C speed, and word boundaries
+    are only checked where a word was found.
+    """
+
+    def __init__(self, query: str, window: int = 300) -> None:
+        self.window = window
+        self.words = list(dict.fromkeys(query.lower().split()))
+        self.pattern = re.compile(
+            r"\b(" + "|".join(re.escape(word) for word in self.words) + r")\b",
+            re.IGNORECASE,
+        )
+
+    def is_relevant(self, text: str) -> bool:
+        lowered = text.lower()
+        return any(word in lowered for word in self.words)
+
+    def match(self, text: str) -> Tuple[bool, str]:
+        """
+        Returns whether the text is relevant, and its sections around the
+        query words
+        """
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            is_relevant, spans = self.find_word_spans(lowered)
+        else:
+            # lowercasing changed the length of the text, so positions in
+            # lowered don't line up with text
+            is_relevant = any(word in lowered for word in self.words)
+            spans = [match.span() for match in self.pattern.finditer(text)]
+
+        sections = []
+        last_end_index = 0
+        end_index = None
+        for match_start, match_end in spans:
+            start_index = max(last_end_index, match_start - self.window)
+            if start_index != last_end_index:
+                sections.append("...\n\n")
+            end_index = min(len(text), match_end + self.window)
+            sections.append(text[start_index:end_index])
+            last_end_index = end_index
+
+        if end_index != len(text):
+            sections.append("...")
+
+        return is_relevant, "".join(sections)
+
+    def find_word_spans(self, lowered: str) -> Tuple[bool, List[Tuple[int, int]]]:
+        """
+        Returns whether any word occurs in lowered, and the non-overlapping
+        spans of whole word matches, as the regex \\b(word|...)\\b would find
+        """
+        hits = []
+        for order, word in enumerate(self.words):
+            index = lowered.find(word)
+            while index != -1:
+                hits.append((index, order))
+                index = lowered.find(word, index + 1)
+        hits.sort()
+
+        spans = []
+        last_match_end = 0
+        for start, order in hits:
+            if start < last_match_end:
+                continue
+            end = start + len(self.words[order])
+            if self.is_boundary(lowered, start) and self.is_boundary(lowered, end):
+                spans.append((start, end))
+                last_match_end = end
+        return bool(hits), spans
+
+    def is_boundary(self, text: str, index: int) -> bool:
+        before = index > 0 and is_word_char(text[index - 1])
+        after = index < len(text) and is_word_char(text[index])
+        return before != after
+
+
+@lru_cache(maxsize=128)
+def get_query_matcher(query: str) -> QueryMatcher:
+    return QueryMatcher(query)
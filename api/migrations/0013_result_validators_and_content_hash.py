@@ -0,0 +1,44 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:19
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_content(apps, schema_editor):
+    Result = apps.get_model("api", "Result")
+    results = []
+    for result in Result.objects.only("page_content_text").iterator(chunk_size=500):
+        result.content_hash = hashlib.sha256(
+            result.page_content_text.encode("utf-8")
+        ).hexdigest()
+        results.append(result)
+        if len(results) == 500:
+            Result.objects.bulk_update(results, ["content_hash"])
+            results = []
+    Result.objects.bulk_update(results, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0012_result_page_scrape_log_result_page_scrape_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="result",
+            name="content_hash",
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="result",
+            name="etag",
+            field=models.TextField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="result",
+            name="last_modified",
+            field=models.TextField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(hash_content, migrations.RunPython.noop),
+    ]
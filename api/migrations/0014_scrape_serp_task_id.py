@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0013_result_validators_and_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scrape",
+            name="serp_task_id",
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0014_scrape_serp_task_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SerpCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("keyword", models.TextField()),
+                ("location_code", models.PositiveIntegerField()),
+                ("language_code", models.CharField(max_length=15)),
+                ("device", models.CharField(max_length=15)),
+                ("depth", models.PositiveIntegerField()),
+                ("date", models.DateField()),
+                ("items", models.BinaryField()),
+                ("created_at", models.DateTimeField()),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("misses", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="serpcacheentry",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "keyword",
+                    "location_code",
+                    "language_code",
+                    "device",
+                    "depth",
+                    "date",
+                ),
+                name="unique_serp_cache_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:27
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+def schedule_queries(apps, schema_editor):
+    """
+    Sets next_run_at to the first of the next month the query was due in
+    the monthly schedule it ran on until now
+    """
+    Query = apps.get_model("api", "Query")
+    now = datetime.now(timezone.utc)
+    queries = []
+    for query in Query.objects.all().iterator(chunk_size=500):
+        year, month = now.year, now.month + 1
+        while True:
+            if month > 12:
+                year, month = year + 1, 1
+            num_months = (year - query.created_at.year) * 12 + (
+                month - query.created_at.month
+            )
+            if num_months % query.interval_no_of_months == 0:
+                break
+            month += 1
+        query.next_run_at = datetime(year, month, 1, tzinfo=timezone.utc)
+        queries.append(query)
+        if len(queries) == 500:
+            Query.objects.bulk_update(queries, ["next_run_at"])
+            queries = []
+    Query.objects.bulk_update(queries, ["next_run_at"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0015_serpcacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="query",
+            name="next_run_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, default=None, null=True
+            ),
+        ),
+        migrations.RunPython(schedule_queries, migrations.RunPython.noop),
+    ]
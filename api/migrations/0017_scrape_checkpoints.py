@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0016_query_next_run_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scrape",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="scrape",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="scrape",
+            name="serp_items",
+            field=models.JSONField(blank=True, default=None, null=True),
+        ),
+    ]
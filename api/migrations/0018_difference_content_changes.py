@@ -0,0 +1,127 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:52
+
+import difflib
+import json
+
+from django.db import migrations, models
+
+
+def get_changes_from_lines(lines):
+    """
+    Returns the [i1, i2, j1, j2] changes of a list of Differ lines
+    """
+    changes = []
+    change = None
+    i = j = 0
+    for line in lines:
+        code = line[:2]
+        if code == "  ":
+            change = None
+            i += 1
+            j += 1
+        elif code in ("- ", "+ "):
+            if change is None:
+                change = [i, i, j, j]
+                changes.append(change)
+            if code == "- ":
+                i += 1
+                change[1] = i
+            else:
+                j += 1
+                change[3] = j
+    return changes
+
+
+def convert_differences(apps, schema_editor):
+    Difference = apps.get_model("api", "Difference")
+    differences = (
+        Difference.objects.filter(content_difference__isnull=False)
+        .select_related("result1", "result2")
+        .only(
+            "content_difference",
+            "result1__page_content_text",
+            "result2__page_content_text",
+        )
+    )
+
+    converted = []
+    converted_count = legacy_count = size_before = size_after = 0
+    for difference in differences.iterator(chunk_size=200):
+        lines = json.loads(difference.content_difference)
+        lines1 = difference.result1.page_content_text.splitlines()
+        lines2 = difference.result2.page_content_text.splitlines()
+        if lines:
+            # the lines must rebuild both contents to be replaced by changes
+            reconstructed = (
+                list(difflib.restore(lines, 1)) == lines1
+                and list(difflib.restore(lines, 2)) == lines2
+            )
+        else:
+            # differences of unchanged contents were stored empty
+            reconstructed = lines1 == lines2
+        if not reconstructed:
+            legacy_count += 1
+            continue
+
+        size_before += len(difference.content_difference)
+        difference.content_changes = get_changes_from_lines(lines)
+        difference.content_difference = None
+        size_after += len(json.dumps(difference.content_changes))
+        converted.append(difference)
+        converted_count += 1
+        if len(converted) == 200:
+            Difference.objects.bulk_update(
+                converted, ["content_changes", "content_difference"])
+            converted = []
+    Difference.objects.bulk_update(converted, ["content_changes", "content_difference"])
+
+    print(
+        f"\n  Converted {converted_count} differences to changes, "
+        f"{size_before} bytes to {size_after} bytes"
+        + (f" ({1 - size_after / size_before:.1%} smaller)" if size_before else "")
+        + f", kept {legacy_count} as Differ lines"
+    )
+
+
+def render_differences(apps, schema_editor):
+    Difference = apps.get_model("api", "Difference")
+    differences = Difference.objects.filter(content_changes__isnull=False).select_related(
+        "result1", "result2"
+    )
+
+    rendered = []
+    for difference in differences.iterator(chunk_size=200):
+        lines1 = difference.result1.page_content_text.splitlines()
+        lines2 = difference.result2.page_content_text.splitlines()
+        lines = []
+        i = j = 0
+        for i1, i2, j1, j2 in difference.content_changes + [
+            [len(lines1), len(lines1), len(lines2), len(lines2)]
+        ]:
+            lines.extend("  " + line for line in lines1[i:i1])
+            lines.extend("- " + line for line in lines1[i1:i2])
+            lines.extend("+ " + line for line in lines2[j1:j2])
+            i, j = i2, j2
+        difference.content_difference = json.dumps(lines)
+        difference.content_changes = None
+        rendered.append(difference)
+        if len(rendered) == 200:
+            Difference.objects.bulk_update(
+                rendered, ["content_changes", "content_difference"])
+            rendered = []
+    Difference.objects.bulk_update(rendered, ["content_changes", "content_difference"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0017_scrape_checkpoints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="difference",
+            name="content_changes",
+            field=models.JSONField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(convert_differences, render_differences),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:42
+
+import hashlib
+
+from django.db import migrations, models
+
+from api.utils import normalize_url
+
+
+def hash_page_links(apps, schema_editor):
+    Result = apps.get_model("api", "Result")
+    results = []
+    for result in Result.objects.only("page_link").iterator(chunk_size=1000):
+        result.page_link_hash = hashlib.sha1(
+            normalize_url(result.page_link).encode("utf-8")
+        ).hexdigest()
+        results.append(result)
+        if len(results) == 1000:
+            Result.objects.bulk_update(results, ["page_link_hash"])
+            results = []
+    Result.objects.bulk_update(results, ["page_link_hash"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0018_difference_content_changes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="result",
+            name="page_link_hash",
+            field=models.CharField(blank=True, default=None, max_length=40, null=True),
+        ),
+        migrations.RunPython(hash_page_links, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="difference",
+            index=models.Index(
+                condition=models.Q(("has_difference", True)),
+                fields=["result2"],
+                name="difference_changed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="result",
+            index=models.Index(
+                fields=["scrape", "page_link_hash"], name="result_scrape_link_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="result",
+            index=models.Index(
+                fields=["scrape", "page_scrape_status"], name="result_scrape_status_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:45
+
+from urllib.parse import urlsplit, urlunsplit
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    # api.utils.normalize_url as of this migration
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, parts.query, ""))
+
+
+def backfill(apps, schema_editor):
+    # without them, all the pages of the next scrape of each query count as new
+    Query = apps.get_model("api", "Query")
+    QueryUrl = apps.get_model("api", "QueryUrl")
+    Result = apps.get_model("api", "Result")
+    for query in Query.objects.order_by("id").iterator():
+        query_urls = {}
+        results = (
+            Result.objects.filter(scrape__query=query, page_scrape_status="success")
+            .order_by("scrape_id")
+            .values_list("scrape_id", "page_link", "page_link_hash")
+        )
+        for scrape_id, page_link, page_link_hash in results.iterator(chunk_size=2000):
+            if page_link_hash not in query_urls:
+                query_urls[page_link_hash] = QueryUrl(
+                    query=query,
+                    normalized_url=normalize_url(page_link),
+                    url_hash=page_link_hash,
+                    first_seen_scrape_id=scrape_id,
+                )
+            query_urls[page_link_hash].last_seen_scrape_id = scrape_id
+        QueryUrl.objects.bulk_create(list(query_urls.values()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0019_result_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueryUrl",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("normalized_url", models.TextField()),
+                ("url_hash", models.CharField(max_length=40)),
+                (
+                    "first_seen_scrape",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="first_seen_urls",
+                        to="api.scrape",
+                    ),
+                ),
+                (
+                    "last_seen_scrape",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="last_seen_urls",
+                        to="api.scrape",
+                    ),
+                ),
+                (
+                    "query",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.query"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="queryurl",
+            constraint=models.UniqueConstraint(
+                fields=("query", "url_hash"), name="unique_query_url"
+            ),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
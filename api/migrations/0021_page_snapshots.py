@@ -0,0 +1,134 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:48
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def save_snapshots(PageSnapshot, snapshots, snapshot_ids):
+    PageSnapshot.objects.bulk_create(snapshots.values(), ignore_conflicts=True)
+    snapshot_ids.update(
+        PageSnapshot.objects.filter(content_hash__in=snapshots).values_list(
+            "content_hash", "id"
+        )
+    )
+    snapshots.clear()
+
+
+def snapshot_pages(apps, schema_editor):
+    Result = apps.get_model("api", "Result")
+    PageSnapshot = apps.get_model("api", "PageSnapshot")
+    # ids of the snapshots by content hash, and the snapshots not saved yet
+    snapshot_ids = {}
+    snapshots = {}
+    results = []
+    text_bytes = 0
+    stored_bytes = 0
+
+    def save_batch():
+        save_snapshots(PageSnapshot, snapshots, snapshot_ids)
+        for result in results:
+            result.snapshot_id = snapshot_ids[result.content_hash]
+        Result.objects.bulk_update(results, ["snapshot", "content_hash"])
+        results.clear()
+
+    for result in (
+        Result.objects.exclude(page_content_text="")
+        .only("page_content_text", "content_hash")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        data = result.page_content_text.encode("utf-8")
+        result.content_hash = hashlib.sha256(data).hexdigest()
+        text_bytes += len(data)
+        if (
+            result.content_hash not in snapshot_ids
+            and result.content_hash not in snapshots
+        ):
+            content = zlib.compress(data)
+            stored_bytes += len(content)
+            snapshots[result.content_hash] = PageSnapshot(
+                content_hash=result.content_hash, content=content, size=len(data)
+            )
+        results.append(result)
+        if len(results) == BATCH_SIZE:
+            save_batch()
+    save_batch()
+
+    if text_bytes:
+        print(
+            f"\n  Page text of {text_bytes} bytes stored in {len(snapshot_ids)} "
+            f"snapshots of {stored_bytes} bytes, "
+            f"{1 - stored_bytes / text_bytes:.1%} smaller"
+        )
+
+
+def restore_pages(apps, schema_editor):
+    Result = apps.get_model("api", "Result")
+    results = []
+    for result in (
+        Result.objects.filter(snapshot__isnull=False)
+        .select_related("snapshot")
+        .only("snapshot__content")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        result.page_content_text = zlib.decompress(result.snapshot.content).decode(
+            "utf-8"
+        )
+        results.append(result)
+        if len(results) == BATCH_SIZE:
+            Result.objects.bulk_update(results, ["page_content_text"])
+            results = []
+    Result.objects.bulk_update(results, ["page_content_text"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0020_queryurl"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64, unique=True)),
+                ("content", models.BinaryField()),
+                ("size", models.PositiveIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="result",
+            name="snapshot",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="api.pagesnapshot",
+            ),
+        ),
+        migrations.RunPython(snapshot_pages, restore_pages),
+        # so the column can be added back empty, when unapplied
+        migrations.AlterField(
+            model_name="result",
+            name="page_content_text",
+            field=models.TextField(default=""),
+        ),
+        migrations.RemoveField(
+            model_name="result",
+            name="page_content_text",
+        ),
+    ]
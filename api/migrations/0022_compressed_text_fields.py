@@ -0,0 +1,120 @@
+# Generated by Django 4.2.1 on 2026-10-17 01:52
+
+import zlib
+
+from django.db import migrations
+
+import api.fields
+
+BATCH_SIZE = 500
+
+
+def add_snapshot_headers(apps, schema_editor):
+    # snapshots are already compressed with zlib, they only lack its header
+    PageSnapshot = apps.get_model("api", "PageSnapshot")
+    snapshots = []
+    for snapshot in PageSnapshot.objects.only("content").iterator(chunk_size=BATCH_SIZE):
+        snapshot.content = api.fields.codecs["zlib"].header + bytes(snapshot.content)
+        snapshots.append(snapshot)
+        if len(snapshots) == BATCH_SIZE:
+            PageSnapshot.objects.bulk_update(snapshots, ["content"])
+            snapshots = []
+    PageSnapshot.objects.bulk_update(snapshots, ["content"])
+
+
+def remove_snapshot_headers(apps, schema_editor):
+    PageSnapshot = apps.get_model("api", "PageSnapshot")
+    snapshots = []
+    for snapshot in PageSnapshot.objects.only("content").iterator(chunk_size=BATCH_SIZE):
+        snapshot.content = zlib.compress(
+            api.fields.decompress_text(snapshot.content).encode("utf-8")
+        )
+        snapshots.append(snapshot)
+        if len(snapshots) == BATCH_SIZE:
+            PageSnapshot.objects.bulk_update(snapshots, ["content"])
+            snapshots = []
+    PageSnapshot.objects.bulk_update(snapshots, ["content"])
+
+
+def copy_differences(apps, from_fields, to_fields):
+    Difference = apps.get_model("api", "Difference")
+    differences = []
+    size_before = size_after = 0
+    for difference in Difference.objects.only(*from_fields).iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        for from_field, to_field in zip(from_fields, to_fields):
+            value = getattr(difference, from_field)
+            setattr(difference, to_field, value)
+            if value is not None:
+                size_before += len(value.encode("utf-8"))
+                size_after += len(
+                    Difference._meta.get_field(to_field).get_prep_value(value)
+                )
+        differences.append(difference)
+        if len(differences) == BATCH_SIZE:
+            Difference.objects.bulk_update(differences, to_fields)
+            differences = []
+    Difference.objects.bulk_update(differences, to_fields)
+    return size_before, size_after
+
+
+def compress_differences(apps, schema_editor):
+    size_before, size_after = copy_differences(
+        apps,
+        ["content_difference", "title_difference"],
+        ["compressed_content_difference", "compressed_title_difference"],
+    )
+    print(f"\n  Compressed differences of {size_before} bytes to {size_after} bytes")
+
+
+def decompress_differences(apps, schema_editor):
+    copy_differences(
+        apps,
+        ["compressed_content_difference", "compressed_title_difference"],
+        ["content_difference", "title_difference"],
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0021_page_snapshots"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_snapshot_headers, remove_snapshot_headers),
+        migrations.AlterField(
+            model_name="pagesnapshot",
+            name="content",
+            field=api.fields.CompressedTextField(),
+        ),
+        migrations.AddField(
+            model_name="difference",
+            name="compressed_content_difference",
+            field=api.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="difference",
+            name="compressed_title_difference",
+            field=api.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_differences, decompress_differences),
+        migrations.RemoveField(
+            model_name="difference",
+            name="content_difference",
+        ),
+        migrations.RemoveField(
+            model_name="difference",
+            name="title_difference",
+        ),
+        migrations.RenameField(
+            model_name="difference",
+            old_name="compressed_content_difference",
+            new_name="content_difference",
+        ),
+        migrations.RenameField(
+            model_name="difference",
+            old_name="compressed_title_difference",
+            new_name="title_difference",
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.1 on 2026-10-17 02:00
+
+import api.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0022_compressed_text_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchiveSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("records", models.PositiveIntegerField(default=0)),
+                ("size", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="difference",
+            name="archive_length",
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="difference",
+            name="archive_offset",
+            field=models.PositiveBigIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="pagesnapshot",
+            name="archive_length",
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="pagesnapshot",
+            name="archive_offset",
+            field=models.PositiveBigIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AlterField(
+            model_name="pagesnapshot",
+            name="content",
+            field=api.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="difference",
+            name="archive_segment",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.archivesegment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pagesnapshot",
+            name="archive_segment",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="api.archivesegment",
+            ),
+        ),
+    ]
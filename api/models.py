@@ -1,4 +1,16 @@
-from django.db import models
+import calendar
+import hashlib
+import json
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+from django.db import models, transaction
+
+from api.diff import (get_content_changes, get_opcodes_from_changes,
+                      render_opcodes)
+from api.fields import CompressedTextField
+from api.segments import read_record
+from api.utils import normalize_url
 
 # Enum
 
@@ -9,6 +21,22 @@ class Status(models.TextChoices):
     PENDING = "pending"
 
 
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_url(url: str) -> str:
+    return hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def add_months(date: datetime, months: int) -> datetime:
+    month_index = date.month - 1 + months
+    year = date.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(date.day, calendar.monthrange(year, month)[1])
+    return date.replace(year=year, month=month, day=day)
+
+
 # Create your models here.
 
 
@@ -16,6 +44,11 @@ class Query(models.Model):
     query = models.TextField(null=False, blank=False, unique=True)
     interval_no_of_months = models.PositiveIntegerField(null=False, blank=False)
     created_at = models.DateTimeField(null=False, blank=False, auto_now_add=True)
+    next_run_at = models.DateTimeField(
+        default=None, null=True, blank=True, db_index=True)
+
+    def get_next_run_at(self, last_run_at: datetime) -> datetime:
+        return add_months(last_run_at, self.interval_no_of_months)
 
 
 class Scrape(models.Model):
@@ -30,14 +63,139 @@ class Scrape(models.Model):
         max_length=15,
     )
     log = models.TextField(default=None, null=True, blank=True)
+    # id of the DataForSEO task posted for the SERP, until its result is collected
+    serp_task_id = models.CharField(
+        default=None, null=True, blank=True, max_length=64)
+    # organic SERP items of the scrape, saved once fetched so it can resume
+    serp_items = models.JSONField(default=None, null=True, blank=True)
+    # last sign of progress, or when the scrape is expected to start
+    heartbeat_at = models.DateTimeField(default=None, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+
+class ArchiveSegment(models.Model):
+    """
+    A file of content archived out of the database, see api.archive
+    """
+
+    created_at = models.DateTimeField(null=False, blank=False, auto_now_add=True)
+    records = models.PositiveIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0)
+
+
+class ArchivedModel(models.Model):
+    """
+    A model whose content fields can be moved to an archive segment, keeping
+    the rest of the row. The offset and length of the record of an archived
+    row are kept to read its content back.
+    """
+
+    # fields moved to the archive
+    archived_fields: Tuple[str, ...] = ()
+
+    archive_segment = models.ForeignKey(
+        ArchiveSegment,
+        on_delete=models.PROTECT,
+        related_name="+",
+        default=None,
+        null=True,
+        blank=True,
+    )
+    archive_offset = models.PositiveBigIntegerField(default=None, null=True, blank=True)
+    archive_length = models.PositiveIntegerField(default=None, null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def get_archive_record(self) -> dict:
+        return {
+            "model": self._meta.label_lower,
+            "id": self.id,
+            "fields": {
+                field: self._meta.get_field(field).value_from_object(self)
+                for field in self.archived_fields
+            },
+        }
+
+    def load_archived(self) -> None:
+        """
+        Reads the content of an archived row back from its archive segment
+        """
+        if self.archive_segment_id is None or getattr(self, "_archive_loaded", False):
+            return
+        record = read_record(
+            self.archive_segment_id, self.archive_offset, self.archive_length)
+        for field, value in record["fields"].items():
+            setattr(self, field, value)
+        self._archive_loaded = True
+
+
+class PageSnapshot(ArchivedModel):
+    """
+    The text of a page, stored once for all the results with the same
+    content, keyed by its hash
+    """
+
+    archived_fields = ("content",)
+
+    content_hash = models.CharField(null=False, blank=False, max_length=64, unique=True)
+    # None once archived
+    content = CompressedTextField(null=True, blank=True)
+    # size of the text before compression, in bytes
+    size = models.PositiveIntegerField(null=False, blank=False)
+    created_at = models.DateTimeField(null=False, blank=False, auto_now_add=True)
+
+    @classmethod
+    def from_text(cls, text: str) -> "PageSnapshot":
+        """
+        Returns an unsaved snapshot of the text
+        """
+        return cls(
+            content_hash=hash_text(text), content=text, size=len(text.encode("utf-8"))
+        )
+
+    @property
+    def text(self) -> str:
+        self.load_archived()
+        return self.content
+
+    @classmethod
+    def save_all(cls, snapshots: Iterable["PageSnapshot"]) -> None:
+        """
+        Saves the unsaved snapshots at once, pointing those whose content is
+        already stored to the stored snapshot
+        """
+        unsaved = {}
+        for snapshot in snapshots:
+            if snapshot.pk is None:
+                unsaved.setdefault(snapshot.content_hash, []).append(snapshot)
+        if not unsaved:
+            return
+
+        cls.objects.bulk_create(
+            [snapshots[0] for snapshots in unsaved.values()], ignore_conflicts=True
+        )
+        ids = dict(
+            cls.objects.filter(content_hash__in=unsaved).values_list("content_hash", "id")
+        )
+        for content_hash, snapshots in unsaved.items():
+            for snapshot in snapshots:
+                snapshot.pk = ids[content_hash]
+                snapshot._state.adding = False
 
 
 class Result(models.Model):
     scrape = models.ForeignKey(Scrape, on_delete=models.CASCADE)
     page_title = models.TextField(null=False, blank=False)
     page_link = models.TextField(null=False, blank=False)
+    # hash of the normalized page link, to look pages up by link with an index
+    page_link_hash = models.CharField(
+        default=None, null=True, blank=True, max_length=40)
     page_ranking = models.PositiveIntegerField(null=False, blank=False)
-    page_content_text = models.TextField(null=False, blank=False)
+    # the text of the page, None for pages that were not scraped
+    snapshot = models.ForeignKey(
+        PageSnapshot, on_delete=models.PROTECT, default=None, null=True, blank=True
+    )
     page_scrape_status = models.CharField(
         choices=Status.choices,
         default=Status.PENDING,
@@ -46,16 +204,158 @@ class Result(models.Model):
         max_length=15,
     )
     page_scrape_log = models.TextField(default=None, null=True, blank=True)
+    etag = models.TextField(default=None, null=True, blank=True)
+    last_modified = models.TextField(default=None, null=True, blank=True)
+    content_hash = models.CharField(
+        default=None, null=True, blank=True, max_length=64)
+
+    class Meta:
+        indexes = [
+            # results of a scrape by page, and by status
+            models.Index(fields=["scrape", "page_link_hash"], name="result_scrape_link_idx"),
+            models.Index(
+                fields=["scrape", "page_scrape_status"], name="result_scrape_status_idx"
+            ),
+        ]
+
+    @property
+    def page_content_text(self) -> str:
+        return self.snapshot.text if self.snapshot is not None else ""
 
+    @page_content_text.setter
+    def page_content_text(self, text: str) -> None:
+        self.snapshot = PageSnapshot.from_text(text) if text else None
+
+    def save(self, *args, **kwargs):
+        if self.snapshot_id is None and self.snapshot is not None:
+            PageSnapshot.save_all([self.snapshot])
+        super().save(*args, **kwargs)
+
+    def get_content_hash(self) -> str:
+        if self.content_hash is None:
+            return hash_text(self.page_content_text)
+        return self.content_hash
+
+
+class Difference(ArchivedModel):
+    archived_fields = ("content_difference", "content_changes", "title_difference")
 
-class Difference(models.Model):
     result1 = models.ForeignKey(
         Result, on_delete=models.CASCADE, related_name="result1"
     )
     result2 = models.ForeignKey(
         Result, on_delete=models.CASCADE, related_name="result2"
     )
-    content_difference = models.TextField(null=True, blank=True)
-    title_difference = models.TextField(null=True, blank=True)
+    # Differ lines of the content, for differences stored before content_changes
+    content_difference = CompressedTextField(null=True, blank=True)
+    # [i1, i2, j1, j2] lines of result1 changed to lines of result2, None
+    # until computed for differences recorded lazily
+    content_changes = models.JSONField(default=None, null=True, blank=True)
+    title_difference = CompressedTextField(null=True, blank=True)
     ranking_difference = models.IntegerField(null=False, blank=False)
     has_difference = models.BooleanField(null=False, blank=False)
+
+    class Meta:
+        indexes = [
+            # the few differences with changes, by result
+            models.Index(
+                fields=["result2"],
+                condition=models.Q(has_difference=True),
+                name="difference_changed_idx",
+            ),
+        ]
+
+    def get_content_difference(self, intraline: bool = False) -> List[str]:
+        """
+        Returns the difference of the content as Differ lines, rendered from
+        the changes and the content of both results
+        """
+        self.load_archived()
+        if self.content_changes is None and self.content_difference is not None:
+            return json.loads(self.content_difference)
+        if self.content_changes is None:
+            self.compute_content_changes()
+
+        lines1 = self.result1.page_content_text.splitlines()
+        lines2 = self.result2.page_content_text.splitlines()
+        opcodes = get_opcodes_from_changes(
+            self.content_changes, len(lines1), len(lines2))
+        return render_opcodes(lines1, lines2, opcodes, intraline)
+
+    def compute_content_changes(self) -> None:
+        """
+        Computes and saves the content changes of a difference recorded
+        lazily. The row is locked meanwhile, so concurrent readers wait for
+        the changes instead of computing them again.
+        """
+        with transaction.atomic():
+            difference = (
+                Difference.objects.select_for_update()
+                .only("content_changes")
+                .get(id=self.id)
+            )
+            if difference.content_changes is None:
+                difference.content_changes = get_content_changes(
+                    self.result1.page_content_text, self.result2.page_content_text
+                )
+                difference.save(update_fields=["content_changes"])
+        self.content_changes = difference.content_changes
+
+
+class QueryUrl(models.Model):
+    """
+    A page seen in the scrapes of a query, with the scrapes it was first and
+    last seen in, so pages new to the query are found without going through
+    all its results
+    """
+
+    query = models.ForeignKey(Query, on_delete=models.CASCADE)
+    normalized_url = models.TextField(null=False, blank=False)
+    # hash of normalized_url, the same as the page_link_hash of its results
+    url_hash = models.CharField(null=False, blank=False, max_length=40)
+    first_seen_scrape = models.ForeignKey(
+        Scrape, on_delete=models.SET_NULL, null=True, related_name="first_seen_urls"
+    )
+    last_seen_scrape = models.ForeignKey(
+        Scrape, on_delete=models.SET_NULL, null=True, related_name="last_seen_urls"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["query", "url_hash"], name="unique_query_url"
+            )
+        ]
+
+
+class SerpCacheEntry(models.Model):
+    """
+    The raw SERP items returned by DataForSEO for a request, compressed with
+    zlib, with counters of cache hits and misses for the request
+    """
+
+    keyword = models.TextField(null=False, blank=False)
+    location_code = models.PositiveIntegerField(null=False, blank=False)
+    language_code = models.CharField(null=False, blank=False, max_length=15)
+    device = models.CharField(null=False, blank=False, max_length=15)
+    depth = models.PositiveIntegerField(null=False, blank=False)
+    date = models.DateField(null=False, blank=False)
+    items = models.BinaryField(null=False, blank=False)
+    created_at = models.DateTimeField(null=False, blank=False)
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "keyword",
+                    "location_code",
+                    "language_code",
+                    "device",
+                    "depth",
+                    "date",
+                ],
+                name="unique_serp_cache_key",
+            )
+        ]
@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from api.models import Query, QueryUrl, Result, Scrape, Status
+from api.utils import normalize_url
+
+
+def record_query_urls(scrape: Scrape, results: List[Result]) -> None:
+    """
+    Records the pages of the successful results as seen in the scrape,
+    adding those new to the query as first seen in it
+    """
+    query_urls: Dict[str, QueryUrl] = {}
+    for result in results:
+        if result.page_scrape_status != Status.SUCCESS:
+            continue
+        # an upsert can't touch the same row twice
+        query_urls[result.page_link_hash] = QueryUrl(
+            query_id=scrape.query_id,
+            normalized_url=normalize_url(result.page_link),
+            url_hash=result.page_link_hash,
+            first_seen_scrape=scrape,
+            last_seen_scrape=scrape,
+        )
+    QueryUrl.objects.bulk_create(
+        list(query_urls.values()),
+        update_conflicts=True,
+        unique_fields=["query", "url_hash"],
+        update_fields=["last_seen_scrape"],
+    )
+
+
+def get_new_results(scrape: Scrape) -> QuerySet:
+    """
+    Returns the successful results of the scrape whose pages were first
+    seen in the scrape
+    """
+    return Result.objects.filter(
+        scrape=scrape,
+        page_scrape_status=Status.SUCCESS,
+        page_link_hash__in=QueryUrl.objects.filter(
+            query_id=scrape.query_id, first_seen_scrape=scrape
+        ).values("url_hash"),
+    )
+
+
+def backfill_query_urls(query: Query) -> int:
+    """
+    Rebuilds the pages seen by the query from the results of its scrapes,
+    returning their number
+    """
+    query_urls: Dict[str, QueryUrl] = {}
+    results = (
+        Result.objects.filter(scrape__query=query, page_scrape_status=Status.SUCCESS)
+        .order_by("scrape_id")
+        .values_list("scrape_id", "page_link", "page_link_hash")
+    )
+    for scrape_id, page_link, page_link_hash in results.iterator(chunk_size=2000):
+        if page_link_hash not in query_urls:
+            query_urls[page_link_hash] = QueryUrl(
+                query=query,
+                normalized_url=normalize_url(page_link),
+                url_hash=page_link_hash,
+                first_seen_scrape_id=scrape_id,
+            )
+        query_urls[page_link_hash].last_seen_scrape_id = scrape_id
+
+    with transaction.atomic():
+        QueryUrl.objects.filter(query=query).delete()
+        QueryUrl.objects.bulk_create(list(query_urls.values()), batch_size=1000)
+    return len(query_urls)
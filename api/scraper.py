@@ -1,25 +1,34 @@
-import difflib
 import json
 import logging
-import os
 import re
-import time
-from base64 import b64encode
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Tuple
 
-import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from selenium.webdriver.chrome.options import Options
+from redis.exceptions import RedisError
 from selenium.webdriver.common.by import By
-from undetected_chromedriver import Chrome
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
-from api.models import Difference, Result, Scrape, Status
+from api.browser_pool import get_browser_pool
+from api.dataforseo import DataForSEOClient
+from api.compute import get_compute_pool
+from api.diff import Change, get_content_changes, get_diff_engine
+from api.extraction import extract_text, get_charset, get_content_kind
+from api.fetcher import ConcurrentFetcher, Page
+from api.http_client import get_http_client, read_body
+from api.locks import QueryLock, heartbeat
+from api.matcher import get_query_matcher
+from api.models import (Difference, PageSnapshot, Query, Result, Scrape,
+                        Status, hash_text, hash_url)
+from api.query_urls import get_new_results, record_query_urls
+from api.utils import normalize_url
 
 load_dotenv()
 logging.basicConfig(
@@ -27,22 +36,34 @@ logging.basicConfig(
 )
 
 
-class Scraper:
-    def __init__(self, scrape: Scrape) -> None:
-        self.scrape = scrape
+class ScrapeSuperseded(Exception):
+    """
+    Raised when a later attempt of a scrape took over from the attempt
+    running
+    """
 
-        base64_bytes = b64encode(
-            ("%s:%s" % (os.getenv("DFS_EMAIL"), os.getenv("DFS_PASSWORD"))).encode(
-                "ascii"
-            )
-        ).decode("ascii")
 
-        self.headers = {
-            "Authorization": f"Basic {base64_bytes}",
-            "Content-Type": "application/json",
-        }
+class Scraper:
+    """
+    Scrapes the pages of a scrape. attempt is the attempt of the scrape this
+    scraper runs for; once a later attempt takes over, the scraper stops
+    writing to the scrape.
+    """
 
-        self.driver = None
+    def __init__(self, scrape: Scrape, attempt: int | None = None) -> None:
+        self.scrape = scrape
+        self.attempt = attempt
+        self.matcher = get_query_matcher(scrape.query.query)
+
+        self.serp_client = DataForSEOClient()
+        self.fetcher = ConcurrentFetcher(
+            self.request_page,
+            max_workers=settings.SCRAPER_MAX_CONCURRENCY,
+            per_host=settings.SCRAPER_PER_HOST_CONCURRENCY,
+            deadline=settings.SCRAPER_DEADLINE_SECONDS,
+        )
+        # results of the previous scrape of the query, by page link
+        self.previous_results = {}
         self.special_sites = [
             "linkedin.com",
             "instagram.com",
@@ -50,244 +71,524 @@ class Scraper:
             "pinterest.com",
             "twitter.com",
         ]
+        # element holding the content on each special site
+        self.site_selectors = {
+            "linkedin.com": (By.CLASS_NAME, "scaffold-layout__main"),
+            "instagram.com": (By.CLASS_NAME, "_aa_c"),
+            "facebook.com": (By.CLASS_NAME, "x1yztbdb"),
+            "pinterest.com": (By.CLASS_NAME, "Jea.KS5.a3i.jzS.zI7.iyn.Hsu"),
+            "twitter.com": (By.CLASS_NAME, "css-1dbjc4n.r-1ifxtd0.r-ymttw5.r-ttdzmv"),
+        }
 
     def get_serp_data(self) -> List[dict]:
         logging.info(f"Fetching SERP data for {self.scrape.query.query}")
-        url = "https://api.dataforseo.com/v3/serp/google/organic/live/advanced"
+        return self.serp_client.live(self.scrape.query.query)
 
-        payload = [
+    def get_organic_items(self, serp_items: List[dict] | None = None) -> List[dict]:
+        """
+        Returns the organic items of the SERP of the query, fetching the SERP
+        unless its items are given. The items are saved on the scrape, so a
+        resumed scrape goes through the same items.
+        """
+        if self.scrape.serp_items is not None:
+            return self.scrape.serp_items
+
+        data = serp_items if serp_items is not None else self.get_serp_data()
+        self.scrape.serp_items = [
+            # only the fields the scrape uses
             {
-                "keyword": self.scrape.query.query,
-                "location_code": 2826,
-                "language_code": "en",
-                "device": "desktop",
-                "os": "windows",
-                "depth": 100,
+                "type": serp_item["type"],
+                "title": serp_item["title"],
+                "url": serp_item["url"],
+                "rank_absolute": serp_item["rank_absolute"],
             }
+            for serp_item in data
+            if serp_item["type"] == "organic"
         ]
+        self.scrape.save(update_fields=["serp_items"])
+        return self.scrape.serp_items
 
-        response = requests.request(
-            "POST", url, headers=self.headers, json=payload)
+    def get_pending_items(
+        self, serp_items: List[dict]
+    ) -> Tuple[List[Result], List[dict]]:
+        """
+        Returns the results already saved successfully by an earlier attempt
+        of the scrape, and the serp items still to be scraped. Failed results
+        of the items still to be scraped are deleted, as they are retried.
+        """
+        saved_results = {
+            result.page_link: result
+            for result in Result.objects.filter(scrape=self.scrape)
+        }
+        results = []
+        pending_items = []
+        for serp_item in serp_items:
+            result = saved_results.get(serp_item["url"])
+            if result and result.page_scrape_status == Status.SUCCESS:
+                results.append(result)
+            else:
+                pending_items.append(serp_item)
 
-        try:
-            return response.json()["tasks"][0]["result"][0]["items"]
-        except (KeyError, IndexError):
-            raise Exception(response.text)
+        if results:
+            logging.info(
+                f"Resuming scraping for {self.scrape.query.query} with "
+                f"{len(pending_items)} of {len(serp_items)} pages left"
+            )
+        Result.objects.filter(
+            scrape=self.scrape,
+            page_link__in=[serp_item["url"] for serp_item in pending_items],
+        ).delete()
+        return results, pending_items
+
+    def is_superseded(self, lock: bool = False) -> bool:
+        """
+        Returns whether a later attempt of the scrape took over from this
+        one, or the scrape is no longer pending. With lock, the scrape is
+        locked until the end of the transaction, so no attempt takes over
+        while this one writes.
+        """
+        if self.attempt is None:
+            return False
+        scrapes = Scrape.objects.filter(
+            id=self.scrape.id, status=Status.PENDING, attempts=self.attempt
+        )
+        if lock:
+            scrapes = scrapes.select_for_update()
+        return not scrapes.values_list("id", flat=True)
+
+    def get_superseded_error(self) -> ScrapeSuperseded:
+        return ScrapeSuperseded(
+            f"Attempt {self.attempt} of scrape {self.scrape.id} was superseded")
+
+    def beat(self) -> None:
+        """
+        Records that the scrape is making progress, so it isn't requeued
+        """
+        self.scrape.heartbeat_at = datetime.now(timezone.utc)
+        Scrape.objects.filter(id=self.scrape.id).update(
+            heartbeat_at=self.scrape.heartbeat_at)
 
-    def start(self) -> None:
+    def start(self, serp_items: List[dict] | None = None) -> None:
+        """
+        Scrapes the pages of the SERP of the query, fetching the SERP first
+        unless its items are given
+        """
         logging.info(f"Starting scraping for {self.scrape.query.query}")
+        self.load_previous_results()
 
-        previous_scrape = (
-            Scrape.objects.filter(query=self.scrape.query,
-                                  completed_at__isnull=False)
-            .exclude(id=self.scrape.id)
-            .order_by("-completed_at")
-            .first()
-        )
+        try:
+            serp_items = self.get_organic_items(serp_items)
+            results, pending_items = self.get_pending_items(serp_items)
+            unsaved_results = []
+
+            def on_fetched(index: int, page: Page | Exception) -> None:
+                # save the results in batches as their pages are fetched, as
+                # checkpoints
+                unsaved_results.append(self.build_result(pending_items[index], page))
+                if len(unsaved_results) >= settings.SCRAPER_BATCH_SIZE:
+                    results.extend(self.save_results(unsaved_results))
+                    unsaved_results.clear()
+
+            with heartbeat(QueryLock(self.scrape.query_id), self.scrape.id):
+                self.fetcher.fetch_all(
+                    [serp_item["url"] for serp_item in pending_items], on_fetched
+                )
+            results.extend(self.save_results(unsaved_results))
+            logging.info(f"HTTP connection stats: {get_http_client().get_stats()}")
+        except ScrapeSuperseded as e:
+            logging.info(str(e))
+            return
+        except Exception as e:
+            logging.error("Error: " + str(e))
+            if self.update_scrape(Status.FAILED, str(e)):
+                self.send_email_unique_urls()
+            return
 
+        self.finish(results)
+
+    def scrape_page(self, serp_item: dict) -> Result | None:
+        """
+        Scrapes the page of a single serp item, for scrapes fanned out as one
+        task per page
+        """
+        if self.is_superseded():
+            logging.info(str(self.get_superseded_error()))
+            return None
+        self.load_previous_results([serp_item["url"]])
         try:
-            data = self.get_serp_data()
-            for serp_item in data:
-                if serp_item["type"] != "organic":
-                    continue
+            # the fetch may outlast the attempt
+            result = self.get_result(serp_item)
+        except ScrapeSuperseded as e:
+            logging.info(str(e))
+            return None
+        self.beat()
+        return result
+
+    def finish(self, results: List[Result | None]) -> None:
+        """
+        Records the differences of the scraped results from the previous
+        scrape and completes the scrape
+        """
+        if self.is_superseded():
+            logging.info(str(self.get_superseded_error()))
+            return
+        if not self.previous_results:
+            self.load_previous_results()
 
-                result = self.get_result(serp_item)
+        try:
+            compute_pool = get_compute_pool()
+            differences = []
+            diffs = []
+            for result in results:
+                previous_result = result and self.previous_results.get(
+                    normalize_url(result.page_link))
+                if not previous_result:
+                    continue
 
-                if not result or not previous_scrape:
+                if (
+                    settings.SCRAPER_LAZY_DIFFERENCES
+                    or previous_result.get_content_hash() == result.content_hash
+                ):
+                    differences.append(
+                        self.get_lazy_difference(previous_result, result))
                     continue
+                # diff the pages in parallel, recording them as they finish
+                content_changes = compute_pool.submit(
+                    get_content_changes,
+                    previous_result.page_content_text,
+                    result.page_content_text,
+                    settings.SCRAPER_DIFF_ENGINE,
+                )
+                diffs.append((previous_result, result, content_changes))
 
-                try:
-                    previous_result = Result.objects.get(
-                        scrape=previous_scrape, page_link=result.page_link
-                    )
-                    self.get_difference(previous_result, result)
-                except Result.DoesNotExist:
-                    pass
+            for previous_result, result, content_changes in diffs:
+                differences.append(
+                    self.get_difference(
+                        previous_result, result, content_changes.result())
+                )
+
+            with transaction.atomic():
+                if self.is_superseded(lock=True):
+                    raise self.get_superseded_error()
+                # differences recorded by an earlier attempt that didn't finish
+                Difference.objects.filter(result2__scrape=self.scrape).delete()
+                Difference.objects.bulk_create(
+                    differences, batch_size=settings.SCRAPER_BATCH_SIZE)
 
             logging.info(f"Scraping finished for {self.scrape.query.query}")
-            self.update_scrape(Status.SUCCESS)
+            updated = self.update_scrape(Status.SUCCESS)
+        except ScrapeSuperseded as e:
+            logging.info(str(e))
+            return
         except Exception as e:
             logging.error("Error: " + str(e))
-            self.update_scrape(Status.FAILED, str(e))
+            updated = self.update_scrape(Status.FAILED, str(e))
 
-        self.kill_driver()
-        self.send_email_unique_urls()
+        if updated:
+            self.send_email_unique_urls()
 
-    def get_result(self, serp_item: dict) -> Result | None:
+    def get_previous_scrape(self) -> Scrape | None:
+        return (
+            Scrape.objects.filter(query=self.scrape.query,
+                                  completed_at__isnull=False)
+            .exclude(id=self.scrape.id)
+            .order_by("-completed_at")
+            .first()
+        )
+
+    def load_previous_results(self, page_links: List[str] | None = None) -> None:
+        """
+        Loads the results of the previous scrape of the query by normalized
+        page link, only those of the given page links if given. Of the
+        results of the same page, a successful one is kept.
+        """
+        previous_scrape = self.get_previous_scrape()
+        if not previous_scrape:
+            return
+
+        previous_results = Result.objects.filter(
+            scrape=previous_scrape).select_related("snapshot")
+        if page_links is not None:
+            previous_results = previous_results.filter(
+                page_link_hash__in=[hash_url(page_link) for page_link in page_links]
+            )
+        for previous_result in previous_results:
+            url = normalize_url(previous_result.page_link)
+            if (
+                url not in self.previous_results
+                or previous_result.page_scrape_status == Status.SUCCESS
+            ):
+                self.previous_results[url] = previous_result
+
+    def get_result(
+        self, serp_item: dict, page: Page | Exception | None = None
+    ) -> Result | None:
+        """
+        Saves a result for the serp item, returning it if the page was
+        scraped successfully. Raises ScrapeSuperseded if a later attempt took
+        over in the meantime.
+        """
+        result = self.build_result(serp_item, page)
+        with transaction.atomic():
+            if self.is_superseded(lock=True):
+                raise self.get_superseded_error()
+            result.save()
+            record_query_urls(self.scrape, [result])
+        if result.page_scrape_status != Status.SUCCESS:
+            return None
+        return result
+
+    def save_results(self, results: List[Result]) -> List[Result]:
+        """
+        Saves the results at once, returning those of the pages scraped
+        successfully
+        """
+        with transaction.atomic():
+            if self.is_superseded(lock=True):
+                raise self.get_superseded_error()
+            # pages with the same text share their snapshot
+            PageSnapshot.save_all(
+                [result.snapshot for result in results if result.snapshot is not None])
+            Result.objects.bulk_create(
+                results, batch_size=settings.SCRAPER_BATCH_SIZE)
+            record_query_urls(self.scrape, results)
+        self.beat()
+        return [
+            result for result in results if result.page_scrape_status == Status.SUCCESS
+        ]
+
+    def build_result(
+        self, serp_item: dict, page: Page | Exception | None = None
+    ) -> Result:
+        """
+        Returns an unsaved result for the serp item. page is the already
+        fetched page (or the exception raised fetching it); the page is
+        requested here if it is not given.
+        """
         result = Result(
             scrape=self.scrape,
             page_title=serp_item["title"],
             page_link=serp_item["url"],
+            page_link_hash=hash_url(serp_item["url"]),
             page_ranking=serp_item["rank_absolute"],
         )
         try:
-            content = self.request_page(serp_item["url"])
-            query_lowered = self.scrape.query.query.lower()
-            # if (
-            #     query_lowered not in serp_item["title"].lower()
-            #     and query_lowered
-            #     not in serp_item["url"]
-            #     .replace("-", " ")
-            #     .replace("_", " ")
-            #     .replace(".", " ")
-            #     and query_lowered.replace(" ", "") not in serp_item["url"]
-            # ):
-            if all([query not in content.lower() for query in query_lowered.split()]):
-                raise Exception("Query not in returned content.")
-            if not self.is_of_special_site(serp_item["url"]):
-                content = self.search_text(content)
+            if page is None:
+                page = self.request_page(serp_item["url"])
+            elif isinstance(page, Exception):
+                raise page
+
+            result.etag = page.etag
+            result.last_modified = page.last_modified
+            if page.not_modified:
+                # the page is the same as in the previous scrape, and so is
+                # its snapshot
+                previous_result = self.previous_results[normalize_url(serp_item["url"])]
+                result.snapshot = previous_result.snapshot
+                result.content_hash = previous_result.get_content_hash()
+                result.page_scrape_status = Status.SUCCESS
+                result.page_scrape_log = ""
+                return result
+
+            content = page.content
+            if self.is_of_special_site(serp_item["url"]):
+                if not self.matcher.is_relevant(content):
+                    raise Exception("Query not in returned content.")
+            else:
+                is_relevant, content = self.matcher.match(content)
+                if not is_relevant:
+                    raise Exception("Query not in returned content.")
 
             # replace multiple \n with two
             content = re.sub(r'\n{2,}', '\n\n', content)
 
             result.page_content_text = content
+            result.content_hash = hash_text(content)
         except Exception as e:
             logging.error("Error in requesting page: " + str(e))
             result.page_scrape_status = Status.FAILED
             result.page_scrape_log = str(e)
-            result.save()
-            return None
+            return result
         result.page_scrape_status = Status.SUCCESS
         result.page_scrape_log = ""
-        result.save()
         return result
 
-    def get_difference(self, result1: Result, result2: Result):
+    def get_difference(
+        self, result1: Result, result2: Result, content_changes: List[Change]
+    ) -> Difference:
+        """
+        Returns the unsaved difference between two results, given the
+        changes of their content
+        """
         difference = Difference(result1=result1, result2=result2)
-        d = difflib.Differ()
-        text1_lines = result1.page_content_text.splitlines()
-        text2_lines = result2.page_content_text.splitlines()
-        difference.content_difference = json.dumps(
-            list(d.compare(text1_lines, text2_lines))
-        )
-        difference.title_difference = json.dumps(
-            list(d.compare([result1.page_title], [result2.page_title]))
-        )
+        difference.content_changes = content_changes
+        difference.title_difference = self.get_title_difference(result1, result2)
         difference.ranking_difference = result2.page_ranking - result1.page_ranking
         difference.has_difference = (
-            result1.page_content_text != result2.page_content_text
+            result1.get_content_hash() != result2.get_content_hash()
             or result1.page_title != result2.page_title
         )
-        difference.save()
+        return difference
+
+    def get_title_difference(self, result1: Result, result2: Result) -> str:
+        # titles are single lines, so their intraline hints come cheap
+        return json.dumps(
+            get_diff_engine().compare(
+                [result1.page_title], [result2.page_title], intraline=True)
+        )
 
-    def request_page(self, url: str) -> str:
+    def get_lazy_difference(self, result1: Result, result2: Result) -> Difference:
+        """
+        Returns the unsaved difference between two results without diffing
+        the content. The content changes are empty if the content is the same,
+        and are otherwise computed when the difference is first read.
+        """
+        difference = Difference(result1=result1, result2=result2)
+        content_changed = result1.get_content_hash() != result2.get_content_hash()
+        difference.content_changes = None if content_changed else []
+        difference.title_difference = self.get_title_difference(result1, result2)
+        difference.ranking_difference = result2.page_ranking - result1.page_ranking
+        difference.has_difference = (
+            content_changed or result1.page_title != result2.page_title)
+        return difference
+
+    def request_page(self, url: str) -> Page:
         logging.info(f"Fetching Page content for {url}")
         if self.is_of_special_site(url):
-            content = self.request_using_selenium(url)
+            page = Page(self.request_using_selenium(url))
         else:
-            content = self.request_using_requests(url)
-        content = content.strip()
-        if not content:
+            page = self.request_using_requests(
+                url, self.previous_results.get(normalize_url(url)))
+        if page.not_modified:
+            return page
+        page.content = page.content.strip()
+        if not page.content:
             raise Exception("Empty content.")
-        return content
+        return page
 
     def search_text(self, text: str) -> str:
         """
         Returns sections of text where the query or a word from the query is present
         """
-        # Prepare the query by splitting it into individual words
-        query_words = self.scrape.query.query.lower().split()
-
-        # Create a regex pattern to match any of the query words
-        pattern = r"\b(" + "|".join(re.escape(word)
-                                    for word in query_words) + r")\b"
-
-        # Find all matches in the text
-        matches = re.finditer(pattern, text.lower())
-
-        # Extract the sections around each match
-        sections = []
-        last_end_index = 0
-        end_index = None
-        for match in matches:
-            start_index = max(last_end_index, match.start() - 300)
-            if start_index != last_end_index:
-                sections.append("...\n\n")
-            end_index = min(len(text), match.end() + 300)
-            section = text[start_index:end_index]
-            sections.append(section)
-            last_end_index = end_index
-
-        if end_index != len(text):
-            sections.append("...")
-
-        return "".join(sections)
-
-    def request_using_requests(self, url: str) -> str:
-        res = requests.get(
-            url,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
-            },
-            timeout=30
-        )
-        soup = BeautifulSoup(res.content, "html.parser")
-        return soup.text
+        return self.matcher.match(text)[1]
 
-    def request_using_selenium(self, url: str) -> str:
-        self.init_driver()
-        self.driver.get(url)
-        time.sleep(5)
-        try:
-            if "twitter.com" in url:
-                content = "\n".join(
-                    [
-                        el.text
-                        for el in self.driver.find_element(
-                            By.CLASS_NAME, "css-1dbjc4n.r-1ifxtd0.r-ymttw5.r-ttdzmv"
-                        ).find_elements(By.XPATH, "*")[1:4]
-                    ]
-                )
-            elif "pinterest.com" in url:
-                content = "\n".join(
-                    [
-                        el.text
-                        for el in self.driver.find_element(
-                            By.CLASS_NAME, "Jea.KS5.a3i.jzS.zI7.iyn.Hsu"
-                        ).find_elements(By.XPATH, "*")[1:4]
-                    ]
-                )
-            elif "instagram.com" in url:
-                content = self.driver.find_element(By.CLASS_NAME, "_aa_c").text
-            elif "linkedin.com" in url:
-                content = self.driver.find_element(
-                    By.CLASS_NAME, "scaffold-layout__main"
-                ).text
-            elif "facebook.com" in url:
-                content = (
-                    self.driver.find_element(By.TAG_NAME, "h1").text.strip()
-                    + "\n\n"
-                    + self.driver.find_element(By.CLASS_NAME, "x1yztbdb").text.strip()
+    def request_using_requests(
+        self, url: str, previous_result: Result | None = None
+    ) -> Page:
+        """
+        Requests the page, conditionally on the validators of the previous
+        result of the page if it was scraped successfully.
+        """
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+        }
+        if previous_result and previous_result.page_scrape_status == Status.SUCCESS:
+            if previous_result.etag:
+                headers["If-None-Match"] = previous_result.etag
+            if previous_result.last_modified:
+                headers["If-Modified-Since"] = previous_result.last_modified
+
+        with get_http_client().get(
+            url, headers=headers, timeout=30, stream=True
+        ) as res:
+            if res.status_code == 304 and previous_result:
+                return Page(
+                    etag=res.headers.get("ETag", previous_result.etag),
+                    last_modified=res.headers.get(
+                        "Last-Modified", previous_result.last_modified
+                    ),
+                    not_modified=True,
                 )
-            else:
-                content = self.driver.find_element(By.TAG_NAME, "body").text
-        except:
-            content = self.driver.find_element(By.TAG_NAME, "body").text
-        self.kill_driver()
+            content_type = res.headers.get("Content-Type", "")
+            # fail early on types we can't extract, before reading the body
+            if content_type:
+                get_content_kind(content_type, b"")
+            content = read_body(res, settings.SCRAPER_MAX_PAGE_BYTES)
+            return Page(
+                get_compute_pool().run(
+                    extract_text,
+                    content,
+                    content_type,
+                    get_charset(content_type),
+                    settings.SCRAPER_TEXT_EXTRACTOR,
+                ),
+                etag=res.headers.get("ETag"),
+                last_modified=res.headers.get("Last-Modified"),
+            )
+
+    def request_using_selenium(self, url: str) -> str:
+        with get_browser_pool().lease() as driver:
+            driver.get(url)
+            try:
+                self.wait_for_content(driver, url)
+                if "twitter.com" in url or "pinterest.com" in url:
+                    content = "\n".join(
+                        [
+                            el.text
+                            for el in driver.find_element(
+                                *self.get_site_selector(url)
+                            ).find_elements(By.XPATH, "*")[1:4]
+                        ]
+                    )
+                elif "facebook.com" in url:
+                    content = (
+                        driver.find_element(By.TAG_NAME, "h1").text.strip()
+                        + "\n\n"
+                        + driver.find_element(
+                            *self.get_site_selector(url)).text.strip()
+                    )
+                else:
+                    content = driver.find_element(
+                        *self.get_site_selector(url)).text
+            except:
+                content = driver.find_element(By.TAG_NAME, "body").text
         return content
 
-    def update_scrape(self, status: str, log: str = "") -> None:
+    def wait_for_content(self, driver, url: str) -> None:
+        """
+        Waits until the element holding the content of the page has rendered
+        """
+        WebDriverWait(driver, settings.SCRAPER_BROWSER_WAIT_SECONDS).until(
+            EC.presence_of_element_located(self.get_site_selector(url))
+        )
+
+    def get_site_selector(self, url: str) -> Tuple[str, str]:
+        for site, selector in self.site_selectors.items():
+            if site in url:
+                return selector
+        return (By.TAG_NAME, "body")
+
+    def update_scrape(self, status: str, log: str = "") -> bool:
+        """
+        Updates the status of the scrape, returning False if a later attempt
+        took over, in which case the scrape is left to it
+        """
         self.scrape.status = status
         self.scrape.log = log
         if status == Status.SUCCESS:
             self.scrape.completed_at = datetime.now(timezone.utc)
-        self.scrape.save()
-
-    def init_driver(self) -> None:
-        options = Options()
-        options.add_argument("--start-maximized")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        self.driver = Chrome(
-            options=options, headless=os.getenv("ENVIRON") == "prod")
-        self.driver.set_page_load_timeout(30)
-
-    def kill_driver(self) -> None:
-        try:
-            self.driver.quit()
-        except:
-            pass
-        self.driver = None
+        if self.attempt is None:
+            self.scrape.save(update_fields=["status", "log", "completed_at"])
+        elif not Scrape.objects.filter(
+            id=self.scrape.id, status=Status.PENDING, attempts=self.attempt
+        ).update(status=status, log=log, completed_at=self.scrape.completed_at):
+            logging.info(str(self.get_superseded_error()))
+            return False
+
+        if status != Status.PENDING:
+            try:
+                QueryLock(self.scrape.query_id).release(self.scrape.id)
+            except RedisError as e:
+                logging.error("Error releasing scrape lock: " + str(e))
+
+        if status == Status.SUCCESS:
+            # the next run is an interval after this scrape, unless already later
+            query = self.scrape.query
+            next_run_at = query.get_next_run_at(self.scrape.started_at)
+            Query.objects.filter(id=query.id).filter(
+                Q(next_run_at__isnull=True) | Q(next_run_at__lt=next_run_at)
+            ).update(next_run_at=next_run_at)
+        return True
 
     def is_of_special_site(self, url):
         for site in self.special_sites:
@@ -296,18 +597,8 @@ class Scraper:
         return False
 
     def send_email_unique_urls(self) -> None:
-        urls = set(
-            [(result.page_title, result.page_link) for result in Result.objects.filter(scrape=self.scrape, page_scrape_status=Status.SUCCESS)])
-        all_urls = set(
-            [
-                (result.page_title, result.page_link)
-                for result in Result.objects.filter(scrape__query=self.scrape.query, page_scrape_status=Status.SUCCESS).exclude(
-                    scrape=self.scrape
-                )
-            ]
-        )
-
-        unique_urls_added = urls - all_urls
+        unique_urls_added = set(
+            get_new_results(self.scrape).values_list("page_title", "page_link"))
         count_unique_urls = len(unique_urls_added)
 
         logging.info(f"Found {count_unique_urls} unique urls")
@@ -328,8 +619,3 @@ class Scraper:
             html_message=html_message))
         logging.info("Email sent successfully")
 
-
-scrape = Scrape.objects.get(pk=54)
-print(scrape)
-scraper = Scraper(scrape)
-scraper.send_email_unique_urls()
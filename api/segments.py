@@ -0,0 +1,61 @@
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+
+from django.conf import settings
+
+from api.fields import compress_text, decompress_text
+
+
+def get_segment_path(segment_id: int) -> Path:
+    return Path(settings.ARCHIVE_DIR) / f"segment-{segment_id:08d}.jsonl.z"
+
+
+class SegmentWriter:
+    """
+    Appends records to a segment file. Each record is a JSON line compressed
+    on its own, with the codec header of compressed text fields, so it can be
+    read back from its offset and length alone.
+    """
+
+    def __init__(self, segment_id: int) -> None:
+        self.path = get_segment_path(segment_id)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+
+    def append(self, record: dict) -> Tuple[int, int]:
+        """
+        Appends the record, returning its offset and length in the segment
+        """
+        data = compress_text(json.dumps(record) + "\n")
+        offset = self.size
+        self.file.write(data)
+        self.size += len(data)
+        return offset, len(data)
+
+    def flush(self) -> None:
+        # the records must be on disk before rows point to them
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+@lru_cache(maxsize=settings.ARCHIVE_CACHE_SIZE)
+def read_record_line(segment_id: int, offset: int, length: int) -> str:
+    with open(get_segment_path(segment_id), "rb") as file:
+        file.seek(offset)
+        return decompress_text(file.read(length))
+
+
+def read_record(segment_id: int, offset: int, length: int) -> dict:
+    """
+    Returns the record at the offset of the segment, through a cache of the
+    records read last
+    """
+    return json.loads(read_record_line(segment_id, offset, length))
@@ -22,7 +22,17 @@ class ScrapeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Scrape
-        fields = "__all__"
+        # the serp task, serp items, heartbeat and attempts are internal to
+        # the scraper
+        fields = (
+            "id",
+            "query",
+            "query_id",
+            "started_at",
+            "completed_at",
+            "status",
+            "log",
+        )
         read_only_fields = ("query", "started_at", "completed_at", "status", "log")
 
     def create(self, validated_data):
@@ -32,9 +42,24 @@ class ScrapeSerializer(serializers.ModelSerializer):
 
 
 class ResultDetailSerializer(serializers.ModelSerializer):
+    page_content_text = serializers.CharField(read_only=True)
+
     class Meta:
         model = Result
-        fields = "__all__"
+        fields = (
+            "id",
+            "page_title",
+            "page_link",
+            "page_link_hash",
+            "page_ranking",
+            "page_content_text",
+            "page_scrape_status",
+            "page_scrape_log",
+            "etag",
+            "last_modified",
+            "content_hash",
+            "scrape",
+        )
 
 
 class ResultListSerializer(serializers.ModelSerializer):
@@ -54,7 +79,13 @@ class ResultListSerializer(serializers.ModelSerializer):
 class DifferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Difference
-        exclude = ("has_difference",)
+        exclude = (
+            "has_difference",
+            "content_changes",
+            "archive_segment",
+            "archive_offset",
+            "archive_length",
+        )
 
 
 class DifferenceSerializerArray(serializers.ModelSerializer):
@@ -63,4 +94,10 @@ class DifferenceSerializerArray(serializers.ModelSerializer):
 
     class Meta:
         model = Difference
-        exclude = ("has_difference",)
+        exclude = (
+            "has_difference",
+            "content_changes",
+            "archive_segment",
+            "archive_offset",
+            "archive_length",
+        )
@@ -0,0 +1,72 @@
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from django.conf import settings
+from django.db.models import F, Sum
+
+from api.models import SerpCacheEntry
+
+
+def get_cache_key(task_payload: dict) -> dict:
+    return {
+        "keyword": task_payload["keyword"],
+        "location_code": task_payload["location_code"],
+        "language_code": task_payload["language_code"],
+        "device": task_payload["device"],
+        "depth": task_payload["depth"],
+    }
+
+
+def get_cached_serp(task_payload: dict) -> List[dict] | None:
+    """
+    Returns the cached SERP items for the DataForSEO task payload, if they
+    were cached today within the TTL, or at any time if SERP_CACHE_ANY_DATE
+    is set
+    """
+    entries = SerpCacheEntry.objects.filter(**get_cache_key(task_payload))
+    if not settings.SERP_CACHE_ANY_DATE:
+        now = datetime.now(timezone.utc)
+        entries = entries.filter(
+            date=now.date(),
+            created_at__gte=now - timedelta(seconds=settings.SERP_CACHE_TTL_SECONDS),
+        )
+    entry = entries.order_by("-created_at").first()
+    if entry is None:
+        return None
+
+    SerpCacheEntry.objects.filter(id=entry.id).update(hits=F("hits") + 1)
+    logging.info(f"SERP cache hit for {task_payload['keyword']}")
+    return json.loads(zlib.decompress(entry.items))
+
+
+def cache_serp(task_payload: dict, items: List[dict]) -> None:
+    """
+    Caches the SERP items fetched for the DataForSEO task payload, counting
+    the miss that fetched them
+    """
+    now = datetime.now(timezone.utc)
+    entry, _ = SerpCacheEntry.objects.update_or_create(
+        **get_cache_key(task_payload),
+        date=now.date(),
+        defaults={
+            "items": zlib.compress(json.dumps(items).encode("utf-8")),
+            "created_at": now,
+        },
+    )
+    SerpCacheEntry.objects.filter(id=entry.id).update(misses=F("misses") + 1)
+    logging.info(f"SERP cache miss for {task_payload['keyword']}")
+
+
+def get_serp_cache_stats() -> dict:
+    stats = SerpCacheEntry.objects.aggregate(hits=Sum("hits"), misses=Sum("misses"))
+    hits = stats["hits"] or 0
+    misses = stats["misses"] or 0
+    return {
+        "entries": SerpCacheEntry.objects.count(),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0,
+    }
@@ -0,0 +1,50 @@
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Length
+
+from api.models import PageSnapshot, Result
+
+
+def get_orphan_snapshots():
+    """
+    Returns the snapshots no result refers to anymore
+    """
+    return PageSnapshot.objects.filter(result__isnull=True)
+
+
+def get_snapshot_stats() -> dict:
+    """
+    Returns the bytes the page text of the results would take stored inline,
+    against the bytes of their snapshots still in the database. The saved
+    ratio is over the snapshots still in the database, as the content of
+    archived snapshots is counted apart, in their archive segments.
+    """
+    in_database = Q(archive_segment__isnull=True)
+    snapshots = PageSnapshot.objects.aggregate(
+        count=Count("id"),
+        size=Sum("size"),
+        stored_size=Sum(Length("content"), filter=in_database),
+        archived=Count("id", filter=~in_database),
+        archived_size=Sum("archive_length", filter=~in_database),
+    )
+    results = Result.objects.filter(snapshot__isnull=False).aggregate(
+        count=Count("id"),
+        size=Sum("snapshot__size"),
+        in_database_size=Sum(
+            "snapshot__size", filter=Q(snapshot__archive_segment__isnull=True)),
+    )
+    in_database_text_bytes = results["in_database_size"] or 0
+    stored_bytes = snapshots["stored_size"] or 0
+    return {
+        "results": results["count"],
+        "snapshots": snapshots["count"],
+        "orphans": get_orphan_snapshots().count(),
+        "archived": snapshots["archived"],
+        "text_bytes": results["size"] or 0,
+        "in_database_text_bytes": in_database_text_bytes,
+        "snapshot_text_bytes": snapshots["size"] or 0,
+        "stored_bytes": stored_bytes,
+        "archived_bytes": snapshots["archived_size"] or 0,
+        "saved_ratio": (
+            1 - stored_bytes / in_database_text_bytes if in_database_text_bytes else 0
+        ),
+    }
@@ -1,10 +1,21 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
 
-from celery import shared_task
+from celery import chord, shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Coalesce
 
-from api.models import Query, Scrape, Status
+from api import archive
+from api.browser_pool import close_browser_pool
+from api.compute import close_compute_pool
+from api.dataforseo import DataForSEOClient, DataForSEOError
+from api.locks import QueryLock
+from api.models import Query, Result, Scrape, Status
 from api.scraper import Scraper
+from api.serp_cache import get_cached_serp
 from serp_checker.celery import app
 
 logging.basicConfig(
@@ -15,37 +26,310 @@ logging.basicConfig(
 @shared_task
 def scrape_queries():
     logging.info(f"[Scheduled]: Running task to scrape queries")
-    # Get all queries
-    queries = Query.objects.all()
+    now = datetime.now(timezone.utc)
 
-    # Get the current month and year
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-
-    # Iterate over the queries
-    for query in queries:
-        created_month = query.created_at.month
-        created_year = query.created_at.year
-
-        # Calculate the number of months since the query was created
-        num_months = (current_year - created_year) * 12 + (
-            current_month - created_month
+    due_scrapes = []
+    with transaction.atomic():
+        # skip queries locked by an overlapping run of the scheduler
+        queries = Query.objects.select_for_update(skip_locked=True).filter(
+            next_run_at__lte=now
         )
-
-        # Check if the query should be scraped this month based on the interval
-        if num_months % query.interval_no_of_months == 0:
-            # Scrape the query
-            # Your scraping logic goes here
+        for query in queries:
             logging.info(f"[Scheduled]: Scraping query: {query.query}")
 
+            # move the query to its next run, so later runs don't pick it again
+            query.next_run_at = query.get_next_run_at(now)
+            query.save(update_fields=["next_run_at"])
+
             scrape = Scrape(query=query, status=Status.PENDING)
             scrape.save()
-            scraper = Scraper(scrape)
-            scraper.start()
+            due_scrapes.append(scrape)
+
+    # lease each query to its scrape until it is expected to have finished
+    due_scrapes = [
+        scrape
+        for scrape in due_scrapes
+        if claim_scrape(
+            scrape,
+            ttl=settings.SCRAPE_LOCK_TTL_SECONDS + settings.SCRAPE_DISPATCH_WINDOW_SECONDS,
+        ) == scrape
+    ]
+
+    if not due_scrapes:
+        return
+    if settings.DFS_BATCH_MODE:
+        post_serp_tasks(due_scrapes)
+    else:
+        dispatch_scrapes([(scrape.id, None) for scrape in due_scrapes])
+
+
+def get_in_flight_scrape(query: Query) -> Scrape | None:
+    """
+    Returns the scrape of the query holding its lease, if it is still pending
+    """
+    lock = QueryLock(query.id)
+    scrape_id = lock.get_scrape_id()
+    if scrape_id is None:
+        return None
+
+    scrape = Scrape.objects.filter(id=scrape_id, status=Status.PENDING).first()
+    if scrape is None:
+        # the lease outlived its scrape
+        lock.release(scrape_id)
+    return scrape
+
+
+def claim_scrape(scrape: Scrape, ttl: int | None = None) -> Scrape:
+    """
+    Leases the query of a new scrape to it for ttl seconds, and returns it.
+    If another scrape of the query is in flight, the new scrape is deleted
+    and the scrape in flight is returned instead, so duplicate requests
+    coalesce onto it.
+    """
+    lock = QueryLock(scrape.query_id)
+    while not lock.acquire(scrape.id, ttl):
+        in_flight_scrape = get_in_flight_scrape(scrape.query)
+        if in_flight_scrape is not None:
+            logging.info(
+                f"Scrape {in_flight_scrape.id} of {scrape.query.query} is already in flight"
+            )
+            scrape.delete()
+            return in_flight_scrape
+    return scrape
+
+
+def dispatch_scrapes(scrapes: List[Tuple[int, List[dict] | None]]) -> None:
+    """
+    Enqueues the scrapes, given as (scrape id, SERP items) pairs, spread
+    evenly over SCRAPE_DISPATCH_WINDOW_SECONDS so workers, DataForSEO and the
+    scraped sites see a steady load instead of a spike
+    """
+    now = datetime.now(timezone.utc)
+    interval = settings.SCRAPE_DISPATCH_WINDOW_SECONDS / len(scrapes)
+    for index, (scrape_id, serp_items) in enumerate(scrapes):
+        countdown = round(index * interval)
+        # the scrape isn't stale before it is due to start
+        Scrape.objects.filter(id=scrape_id).update(
+            heartbeat_at=now + timedelta(seconds=countdown))
+        perform_scrape.apply_async((scrape_id, serp_items), countdown=countdown)
+    logging.info(
+        f"[Scheduled]: Dispatched {len(scrapes)} scrapes over "
+        f"{settings.SCRAPE_DISPATCH_WINDOW_SECONDS} seconds"
+    )
+
+
+def post_serp_tasks(scrapes: List[Scrape]) -> None:
+    """
+    Posts the SERP of every scrape as a DataForSEO task. The scrapes start
+    when their SERPs are collected by collect_serp_task, or right away if
+    their SERPs are cached.
+    """
+    client = DataForSEOClient()
+    cached_scrapes = []
+    uncached_scrapes = []
+    for scrape in scrapes:
+        serp_items = get_cached_serp(client.get_task_payload(scrape.query.query))
+        if serp_items is None:
+            uncached_scrapes.append(scrape)
+        else:
+            cached_scrapes.append((scrape.id, serp_items))
+    if cached_scrapes:
+        dispatch_scrapes(cached_scrapes)
+
+    task_ids = client.post_tasks(
+        {str(scrape.id): scrape.query.query for scrape in uncached_scrapes}
+    )
+    for scrape in uncached_scrapes:
+        if str(scrape.id) in task_ids:
+            scrape.serp_task_id = task_ids[str(scrape.id)]
+            scrape.save(update_fields=["serp_task_id"])
+        else:
+            Scraper(scrape).update_scrape(
+                Status.FAILED, "Failed to post the SERP task.")
+    logging.info(f"[Scheduled]: Posted {len(task_ids)} SERP tasks")
+
+
+@shared_task
+def collect_serp_tasks():
+    """
+    Collects the SERPs of all ready DataForSEO tasks
+    """
+    for task in DataForSEOClient().get_ready_tasks():
+        collect_serp_task(task["id"], task.get("tag"))
+
+
+@shared_task
+def collect_serp_task(task_id: str, tag: str | None):
+    """
+    Starts the scrape tagged on a ready DataForSEO task with its SERP
+    """
+    if not tag or not tag.isdigit():
+        return
+
+    # claim the task, so a pingback and the poller don't both start the scrape
+    claimed = Scrape.objects.filter(
+        id=tag, serp_task_id=task_id, status=Status.PENDING
+    ).update(serp_task_id=None, heartbeat_at=datetime.now(timezone.utc))
+    if not claimed:
+        return
+
+    try:
+        serp_items = DataForSEOClient().get_task(task_id)
+    except DataForSEOError as e:
+        scrape = Scrape.objects.select_related("query").get(id=tag)
+        Scraper(scrape).update_scrape(Status.FAILED, str(e))
+        return
+    perform_scrape.delay(int(tag), serp_items)
+
+
+@shared_task
+def reap_stale_scrapes():
+    """
+    Requeues the pending scrapes that stopped making progress, e.g. because
+    their worker died, to resume them. Scrapes that were already attempted
+    SCRAPE_MAX_ATTEMPTS times are failed instead.
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(seconds=settings.SCRAPE_HEARTBEAT_TIMEOUT_SECONDS)
+
+    resumed_scrapes = []
+    with transaction.atomic():
+        # skip scrapes locked by an overlapping run of the reaper
+        stale_scrapes = (
+            Scrape.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("query")
+            .alias(last_heartbeat_at=Coalesce("heartbeat_at", "started_at"))
+            .filter(
+                status=Status.PENDING,
+                # scrapes waiting on their DataForSEO task aren't running yet
+                serp_task_id__isnull=True,
+                last_heartbeat_at__lt=stale_before,
+            )
+        )
+        for scrape in stale_scrapes:
+            if scrape.attempts >= settings.SCRAPE_MAX_ATTEMPTS:
+                logging.error(f"[Scheduled]: Giving up on scrape {scrape.id}")
+                Scraper(scrape).update_scrape(
+                    Status.FAILED, f"Scrape stalled after {scrape.attempts} attempts."
+                )
+                continue
+
+            lock = QueryLock(scrape.query_id)
+            if not lock.acquire(scrape.id) and not lock.heartbeat(scrape.id):
+                Scraper(scrape).update_scrape(
+                    Status.FAILED, "Superseded by another scrape of the query."
+                )
+                continue
+
+            scrape.heartbeat_at = now
+            scrape.save(update_fields=["heartbeat_at"])
+            resumed_scrapes.append((scrape.id, scrape.attempts))
+
+    for scrape_id, attempts in resumed_scrapes:
+        logging.info(f"[Scheduled]: Resuming stale scrape {scrape_id}")
+        perform_scrape.delay(scrape_id, attempt=attempts)
+
+
+@shared_task
+def archive_old_content():
+    """
+    Moves the content of old scrapes out of the database, to archive segments
+    """
+    logging.info("[Scheduled]: Running task to archive old content")
+    archive.archive_old_content()
+
+
+@app.task(rate_limit=settings.SCRAPE_RATE_LIMIT)
+def perform_scrape(
+    scrape_id: int, serp_items: List[dict] | None = None, attempt: int = 0
+):
+    """
+    Runs the scrape, as its attempt after the given number of attempts. The
+    attempt is claimed first, so if the reaper requeued the scrape while an
+    attempt was still queued or running, only one of them goes on, and the
+    pages and finish of the other exit.
+    """
+    claimed = Scrape.objects.filter(
+        id=scrape_id, status=Status.PENDING, attempts=attempt
+    ).update(attempts=attempt + 1, heartbeat_at=datetime.now(timezone.utc))
+    if not claimed:
+        logging.info(f"Attempt {attempt + 1} of scrape {scrape_id} was superseded")
+        return
+    attempt += 1
+
+    scrape = Scrape.objects.select_related("query").get(id=scrape_id)
+    QueryLock(scrape.query_id).heartbeat(scrape_id)
+    scraper = Scraper(scrape, attempt)
+    if not settings.SCRAPER_FAN_OUT:
+        scraper.start(serp_items)
+        return
+
+    # fan the pages out as a chord of page tasks, finished by finish_scrape
+    logging.info(f"Starting scraping for {scrape.query.query}")
+    try:
+        serp_items = scraper.get_organic_items(serp_items)
+        _, pending_items = scraper.get_pending_items(serp_items)
+    except Exception as e:
+        logging.error("Error: " + str(e))
+        if scraper.update_scrape(Status.FAILED, str(e)):
+            scraper.send_email_unique_urls()
+        return
+
+    if not pending_items:
+        finish_scrape.delay([], scrape_id, attempt)
+        return
+    chord(
+        scrape_page.s(scrape_id, serp_item, attempt).set(
+            queue="browser" if scraper.is_of_special_site(serp_item["url"]) else "http"
+        )
+        for serp_item in pending_items
+    )(finish_scrape.s(scrape_id, attempt))
+
+
+@app.task
+def scrape_page(
+    scrape_id: int, serp_item: dict, attempt: int | None = None
+) -> int | None:
+    """
+    Scrapes a single page of a scrape, returning the id of its result if it
+    was scraped successfully
+    """
+    try:
+        scrape = Scrape.objects.select_related("query").get(id=scrape_id)
+        QueryLock(scrape.query_id).heartbeat(scrape_id)
+        result = Scraper(scrape, attempt).scrape_page(serp_item)
+    except Exception as e:
+        # a failed page must not fail the chord, or the scrape never finishes
+        logging.error("Error in scraping page: " + str(e))
+        return None
+    return result.id if result else None
 
 
 @app.task
-def perform_scrape(scrape_id: int):
-    scrape = Scrape.objects.get(id=scrape_id)
-    scraper = Scraper(scrape)
-    scraper.start()
+def finish_scrape(
+    result_ids: List[int | None], scrape_id: int, attempt: int | None = None
+):
+    """
+    Finishes a fanned out scrape. Its results are read back from the scrape
+    rather than taken from result_ids, to include those saved by an earlier
+    attempt of the scrape.
+    """
+    scrape = Scrape.objects.select_related("query").get(id=scrape_id)
+    # the text of the results is diffed, so their snapshots are read along
+    Scraper(scrape, attempt).finish(
+        list(
+            Result.objects.filter(
+                scrape=scrape, page_scrape_status=Status.SUCCESS
+            ).select_related("snapshot")
+        )
+    )
+
+
+@worker_process_shutdown.connect
+def shutdown_browser_pool(**kwargs):
+    close_browser_pool()
+
+
+@worker_process_shutdown.connect
+def shutdown_compute_pool(**kwargs):
+    close_compute_pool()
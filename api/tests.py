@@ -1,3 +1,553 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.test import TestCase, override_settings
+from selenium.webdriver.common.by import By
+
+from api.archive import archive_old_content
+from api.browser_pool import BrowserPool
+from api.dataforseo import DataForSEOClient
+from api.diff import get_content_changes
+from api.extraction import extract_text, get_charset, text_extractors
+from api.fetcher import Page
+from api.locks import QueryLock, heartbeat
+from api.models import Difference, PageSnapshot, Query, Result, Scrape, Status
+from api.scraper import Scraper
+from api.segments import read_record_line
+from api.tasks import claim_scrape, collect_serp_task, collect_serp_tasks
+
+UTF8_TEXT = "Café – naïve “quotes” 日本"
+# a page declaring no charset, so only its response tells the encoding
+UTF8_PAGE = f"<html><body><p>{UTF8_TEXT}</p></body></html>".encode("utf-8")
+
+
+class ExtractTextTests(TestCase):
+    def test_html_decoded_with_response_charset(self):
+        for extractor in text_extractors:
+            with self.subTest(extractor=extractor):
+                text = extract_text(
+                    UTF8_PAGE, "text/html; charset=utf-8", "utf-8", extractor)
+                self.assertEqual(text.strip(), UTF8_TEXT)
+
+    def test_html_encoding_sniffed_without_charset(self):
+        for extractor in text_extractors:
+            with self.subTest(extractor=extractor):
+                text = extract_text(UTF8_PAGE, "text/html", None, extractor)
+                self.assertEqual(text.strip(), UTF8_TEXT)
+
+    def test_html_declared_charset(self):
+        page = (
+            '<html><head><meta charset="windows-1252"></head>'
+            "<body><p>Caf\xe9</p></body></html>"
+        ).encode("windows-1252")
+        for extractor in text_extractors:
+            with self.subTest(extractor=extractor):
+                self.assertEqual(
+                    extract_text(page, "text/html", None, extractor).strip(), "Café")
+
+    def test_plain_text_without_charset(self):
+        text = "Café\n"
+        self.assertEqual(extract_text(text.encode("utf-8"), "text/plain"), text)
+        self.assertEqual(
+            extract_text(text.encode("windows-1252"), "text/plain").strip(), "Café")
+
+    def test_plain_text_with_charset(self):
+        self.assertEqual(
+            extract_text(
+                "Café".encode("latin-1"), "text/plain; charset=ISO-8859-1", "ISO-8859-1"),
+            "Café",
+        )
+
+    def test_get_charset(self):
+        self.assertEqual(get_charset('text/html; charset="UTF-8"'), "UTF-8")
+        self.assertIsNone(get_charset("text/plain"))
+
+
+@override_settings(SCRAPER_BATCH_SIZE=20, SCRAPER_LAZY_DIFFERENCES=False)
+class ScrapeTests(TestCase):
+    """
+    Full scrapes of fake pages. The queries of a scrape don't grow with its
+    pages: results and differences are inserted in batches, and the results
+    of the previous scrape are loaded at once.
+    """
+
+    def setUp(self):
+        self.query = Query.objects.create(query="python guide", interval_no_of_months=1)
+        self.pages = {
+            f"https://example.com/{i}": f"python guide {i}" for i in range(50)
+        }
+        for patcher in (
+            mock.patch.object(
+                Scraper, "request_page", lambda scraper, url: Page(self.pages[url])
+            ),
+            # the scrape lock lives in redis
+            mock.patch("api.scraper.QueryLock"),
+            mock.patch("api.scraper.heartbeat"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def scrape(self, urls, num_queries=None):
+        scrape = Scrape.objects.create(query=self.query)
+        serp_items = [
+            {"type": "organic", "title": url, "url": url, "rank_absolute": rank}
+            for rank, url in enumerate(urls, 1)
+        ]
+        if num_queries is None:
+            Scraper(scrape).start(serp_items)
+        else:
+            with self.assertNumQueries(num_queries):
+                Scraper(scrape).start(serp_items)
+        scrape.refresh_from_db()
+        self.assertEqual(scrape.status, Status.SUCCESS)
+        return scrape
+
+    def test_first_scrape(self):
+        # 11 queries, and 7 for each batch of 20 results
+        scrape = self.scrape(list(self.pages), 32)
+        self.assertEqual(scrape.result_set.count(), 50)
+
+    def test_scrape_with_previous_results(self):
+        self.scrape(list(self.pages))
+        for url in list(self.pages)[:10]:
+            self.pages[url] += " changed"
+        # the previous results and their snapshots are loaded in one query,
+        # and the differences inserted in batches
+        scrape = self.scrape(list(self.pages), 35)
+        differences = Difference.objects.filter(result2__scrape=scrape)
+        self.assertEqual(differences.count(), 50)
+        self.assertEqual(differences.filter(has_difference=True).count(), 10)
+
+    def test_page_of_superseded_attempt_not_saved(self):
+        scrape = Scrape.objects.create(query=self.query, attempts=1)
+        url = next(iter(self.pages))
+
+        def request_page_superseded(scraper, url):
+            # the reaper requeues the scrape while the page is fetched
+            Scrape.objects.filter(id=scrape.id).update(attempts=2)
+            return Page(self.pages[url])
+
+        serp_item = {"type": "organic", "title": url, "url": url, "rank_absolute": 1}
+        with mock.patch.object(Scraper, "request_page", request_page_superseded):
+            self.assertIsNone(Scraper(scrape, 1).scrape_page(serp_item))
+        self.assertFalse(scrape.result_set.exists())
+
+    def test_title_difference_of_unchanged_page(self):
+        # unchanged pages are recorded without diffing their content, but
+        # their title is diffed as that of changed pages
+        urls = list(self.pages)[:2]
+        self.scrape(urls)
+        self.pages[urls[1]] += " changed"
+        scrape = self.scrape(urls)
+        for url in urls:
+            difference = Difference.objects.get(
+                result2__scrape=scrape, result2__page_link=url)
+            self.assertEqual(json.loads(difference.title_difference), [f"  {url}"])
+
+    def test_duplicate_links(self):
+        urls = list(self.pages)[:10]
+        self.scrape(urls + urls[:2])
+        scrape = self.scrape(urls + urls[:2], 19)
+        self.assertEqual(scrape.result_set.count(), 12)
+        self.assertEqual(
+            Difference.objects.filter(result2__scrape=scrape).count(), 12)
+
+
+class QueryLockTests(TestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.lock = QueryLock(1, client=self.client, ttl=60)
+
+    def test_acquire(self):
+        self.assertTrue(self.lock.acquire(1))
+        self.assertFalse(self.lock.acquire(2))
+        self.assertEqual(self.lock.get_scrape_id(), 1)
+        self.assertEqual(self.client.ttl(self.lock.key), 60)
+
+    def test_heartbeat(self):
+        self.lock.acquire(1, ttl=5)
+        self.assertTrue(self.lock.heartbeat(1))
+        self.assertEqual(self.client.ttl(self.lock.key), 60)
+        # only the scrape holding the lease renews it
+        self.assertFalse(self.lock.heartbeat(2))
+
+    def test_heartbeat_in_background(self):
+        # renewed every third of its ttl
+        lock = QueryLock(1, client=self.client, ttl=1)
+        lock.acquire(1, ttl=60)
+        with heartbeat(lock, 1):
+            time.sleep(0.5)
+        self.assertEqual(self.client.ttl(lock.key), 1)
+
+    def test_release(self):
+        self.lock.acquire(1)
+        self.assertFalse(self.lock.release(2))
+        self.assertEqual(self.lock.get_scrape_id(), 1)
+        self.assertTrue(self.lock.release(1))
+        self.assertIsNone(self.lock.get_scrape_id())
+        self.assertFalse(self.lock.release(1))
+
+    def test_stale_lease_taken_over(self):
+        self.lock.acquire(1)
+        # the worker of scrape 1 died, and its lease expires
+        self.client.pexpire(self.lock.key, 1)
+        time.sleep(0.01)
+        self.assertTrue(self.lock.acquire(2))
+        self.assertFalse(self.lock.heartbeat(1))
+        self.assertFalse(self.lock.release(1))
+        self.assertEqual(self.lock.get_scrape_id(), 2)
+
+
+class ClaimScrapeTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("api.locks._redis_client", fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.query = Query.objects.create(query="python guide", interval_no_of_months=1)
+
+    def test_claim(self):
+        scrape = Scrape.objects.create(query=self.query)
+        self.assertEqual(claim_scrape(scrape), scrape)
+        self.assertEqual(QueryLock(self.query.id).get_scrape_id(), scrape.id)
+
+    def test_coalesce_onto_scrape_in_flight(self):
+        scrape = claim_scrape(Scrape.objects.create(query=self.query))
+        duplicate = Scrape.objects.create(query=self.query)
+        self.assertEqual(claim_scrape(duplicate), scrape)
+        self.assertFalse(Scrape.objects.filter(id=duplicate.id).exists())
+
+    def test_lease_outliving_its_scrape(self):
+        scrape = claim_scrape(Scrape.objects.create(query=self.query))
+        Scrape.objects.filter(id=scrape.id).update(status=Status.FAILED)
+        new_scrape = Scrape.objects.create(query=self.query)
+        self.assertEqual(claim_scrape(new_scrape), new_scrape)
+        self.assertEqual(QueryLock(self.query.id).get_scrape_id(), new_scrape.id)
+
+
+class FakeDataForSEOHandler(BaseHTTPRequestHandler):
+    """
+    Serves the task endpoints of the DataForSEO API. Posted tasks stay ready
+    until the server is reset, as DataForSEO lists them until collected.
+    """
+
+    protocol_version = "HTTP/1.1"
+    tasks = {}
+    requests = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(("POST", self.path, payload))
+        response_tasks = []
+        for task in payload:
+            task_id = f"task-{len(self.tasks)}"
+            # keywords starting with "invalid" are rejected
+            if task["keyword"].startswith("invalid"):
+                response_tasks.append(
+                    {"status_code": 40501, "status_message": "Invalid Field."})
+                continue
+            self.tasks[task_id] = task
+            response_tasks.append({"id": task_id, "status_code": 20100, "data": task})
+        self.reply({"tasks": response_tasks})
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path, None))
+        if self.path.endswith("/tasks_ready"):
+            self.reply({"tasks": [{"result": [
+                {"id": task_id, "tag": task["tag"]}
+                for task_id, task in self.tasks.items()
+            ]}]})
+            return
+        task = self.tasks[self.path.rsplit("/", 1)[1]]
+        items = [{
+            "type": "organic",
+            "title": task["keyword"],
+            "url": "https://example.com/",
+            "rank_absolute": 1,
+        }]
+        self.reply({"tasks": [{"data": task, "result": [{"items": items}]}]})
+
+    def reply(self, response):
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DataForSEOTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDataForSEOHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeDataForSEOHandler.tasks.clear()
+        FakeDataForSEOHandler.requests.clear()
+        patcher = override_settings(DFS_API_URL=self.base_url, DFS_PINGBACK_URL=None)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.client = DataForSEOClient()
+
+    def get_requests(self, path):
+        return [
+            request for request in FakeDataForSEOHandler.requests
+            if request[1].startswith(path)
+        ]
+
+    def test_post_tasks_in_batches(self):
+        keywords_by_tag = {tag: f"keyword {tag}" for tag in range(250)}
+        task_ids = self.client.post_tasks(keywords_by_tag)
+        self.assertEqual(len(task_ids), 250)
+        posts = self.get_requests("/v3/serp/google/organic/task_post")
+        self.assertEqual([len(payload) for _, _, payload in posts], [100, 100, 50])
+        tasks = FakeDataForSEOHandler.tasks
+        self.assertEqual(tasks[task_ids["42"]]["keyword"], "keyword 42")
+
+    def test_post_tasks_skips_tasks_not_created(self):
+        task_ids = self.client.post_tasks({1: "keyword", 2: "invalid keyword"})
+        self.assertEqual(list(task_ids), ["1"])
+
+    @override_settings(DFS_PINGBACK_URL="https://example.com/api/dataforseo/pingback")
+    def test_post_tasks_with_pingback(self):
+        self.client.post_tasks({1: "keyword"})
+        task = FakeDataForSEOHandler.tasks["task-0"]
+        self.assertEqual(
+            task["pingback_url"],
+            "https://example.com/api/dataforseo/pingback?id=$id&tag=$tag",
+        )
+
+    def test_get_ready_tasks(self):
+        task_ids = self.client.post_tasks({1: "keyword 1", 2: "keyword 2"})
+        self.assertEqual(
+            self.client.get_ready_tasks(),
+            [{"id": task_ids["1"], "tag": "1"}, {"id": task_ids["2"], "tag": "2"}],
+        )
+
+    def post_serp_task(self):
+        query = Query.objects.create(query="python guide", interval_no_of_months=1)
+        scrape = Scrape.objects.create(query=query)
+        task_id = self.client.post_tasks({scrape.id: query.query})[str(scrape.id)]
+        Scrape.objects.filter(id=scrape.id).update(serp_task_id=task_id)
+        return scrape, task_id
+
+    def test_collect_serp_task_claimed_once(self):
+        scrape, task_id = self.post_serp_task()
+        with mock.patch("api.tasks.perform_scrape") as perform_scrape:
+            # the pingback of the task, then the poller finding it ready
+            collect_serp_task(task_id, str(scrape.id))
+            collect_serp_tasks()
+            collect_serp_task(task_id, str(scrape.id))
+
+        perform_scrape.delay.assert_called_once()
+        scrape_id, serp_items = perform_scrape.delay.call_args.args
+        self.assertEqual(scrape_id, scrape.id)
+        self.assertEqual(serp_items[0]["title"], "python guide")
+        self.assertEqual(
+            len(self.get_requests("/v3/serp/google/organic/task_get/")), 1)
+        scrape.refresh_from_db()
+        self.assertIsNone(scrape.serp_task_id)
+
+    def test_poller_racing_pingback(self):
+        scrape, task_id = self.post_serp_task()
+        get_task = DataForSEOClient.get_task
+
+        def get_task_racing_poller(client, task_id):
+            # the poller runs while the pingback fetches the task
+            collect_serp_tasks()
+            return get_task(client, task_id)
+
+        with mock.patch("api.tasks.perform_scrape") as perform_scrape, \
+                mock.patch.object(DataForSEOClient, "get_task", get_task_racing_poller):
+            collect_serp_task(task_id, str(scrape.id))
+
+        perform_scrape.delay.assert_called_once()
+        self.assertEqual(
+            len(self.get_requests("/v3/serp/google/organic/task_get/")), 1)
+
+
+class FakeElement:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def find_elements(self, by: str, value: str) -> List["FakeElement"]:
+        return [FakeElement(line) for line in self.text.splitlines()]
+
+
+class FakeDriver:
+    """
+    Stand-in for a Chrome driver, for testing a BrowserPool without a browser.
+    Every page renders as the text in pages for its url, and every selector
+    matches that text.
+    """
+
+    def __init__(self, pages: Dict[str, str] | None = None) -> None:
+        self.pages = pages or {}
+        self.current_url = None
+        self.crashed = False
+        self.quit_called = False
+
+    @property
+    def window_handles(self) -> List[str]:
+        if self.crashed or self.quit_called:
+            raise Exception("Browser is not running.")
+        return ["main"]
+
+    def get(self, url: str) -> None:
+        if self.crashed:
+            raise Exception("Browser is not running.")
+        self.current_url = url
+
+    def find_element(self, by: str = By.ID, value: str | None = None) -> FakeElement:
+        return FakeElement(self.pages.get(self.current_url, ""))
+
+    def quit(self) -> None:
+        self.quit_called = True
+
+
+class BrowserPoolTests(TestCase):
+    def setUp(self):
+        self.drivers = []
+
+        def create_driver():
+            self.drivers.append(FakeDriver({"https://example.com/": "python guide"}))
+            return self.drivers[-1]
+
+        self.pool = BrowserPool(create_driver, size=2, max_pages=3)
+        self.addCleanup(self.pool.close)
+
+    def test_driver_reused(self):
+        for _ in range(2):
+            with self.pool.lease() as driver:
+                driver.get("https://example.com/")
+                element = driver.find_element(By.TAG_NAME, "body")
+                self.assertEqual(element.text, "python guide")
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_driver_recycled_after_max_pages(self):
+        for _ in range(4):
+            with self.pool.lease() as driver:
+                driver.get("https://example.com/")
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+        self.assertFalse(self.drivers[1].quit_called)
+
+    def test_crashed_driver_discarded(self):
+        with self.assertRaises(Exception):
+            with self.pool.lease() as driver:
+                driver.crashed = True
+                driver.get("https://example.com/")
+        self.assertTrue(self.drivers[0].quit_called)
+        with self.pool.lease() as driver:
+            self.assertIs(driver, self.drivers[1])
+
+    def test_lease_times_out_when_all_drivers_leased(self):
+        with self.pool.lease(), self.pool.lease():
+            with self.assertRaises(TimeoutError):
+                with self.pool.lease(timeout=0.01):
+                    pass
+
+    def test_close_quits_idle_drivers(self):
+        with self.pool.lease():
+            pass
+        self.pool.close()
+        self.assertTrue(self.drivers[0].quit_called)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        patcher = override_settings(ARCHIVE_DIR=archive_dir.name)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        # records are cached by segment id, which restart with each test
+        read_record_line.cache_clear()
+        self.addCleanup(read_record_line.cache_clear)
+
+        self.query = Query.objects.create(query="python guide", interval_no_of_months=1)
+        self.results = []
+        for version in range(3):
+            scrape = Scrape.objects.create(query=self.query, status=Status.SUCCESS)
+            self.results.append((
+                # a page changing every scrape, and a page that never changes
+                self.create_result(scrape, "https://example.com/a", f"python {version}\n"),
+                self.create_result(scrape, "https://example.com/b", "guide\n"),
+            ))
+        self.differences = [
+            Difference.objects.create(
+                result1=result1,
+                result2=result2,
+                content_changes=get_content_changes(
+                    result1.page_content_text, result2.page_content_text),
+                title_difference=json.dumps([f"  {result2.page_title}"]),
+                ranking_difference=0,
+                has_difference=True,
+            )
+            for (result1, _), (result2, _) in zip(self.results, self.results[1:])
+        ]
+
+    def create_result(self, scrape, url, text):
+        result = Result(
+            scrape=scrape,
+            page_title=url,
+            page_link=url,
+            page_ranking=1,
+            page_scrape_status=Status.SUCCESS,
+        )
+        result.page_content_text = text
+        result.save()
+        return result
+
+    def test_archive_round_trip(self):
+        content_differences = [
+            difference.get_content_difference() for difference in self.differences]
+
+        stats = archive_old_content(older_than_days=0, keep_scrapes=1)
+        # the difference and snapshots of the first two scrapes, but the
+        # snapshot of the page that never changes, used by the last scrape
+        self.assertEqual(stats, {"scrapes": 2, "differences": 1, "snapshots": 2})
+
+        archived = Difference.objects.get(id=self.differences[0].id)
+        self.assertIsNotNone(archived.archive_segment_id)
+        self.assertIsNone(archived.content_changes)
+        self.assertEqual(archived.get_content_difference(), content_differences[0])
+        self.assertEqual(
+            json.loads(archived.title_difference), ["  https://example.com/a"])
+        kept = Difference.objects.get(id=self.differences[1].id)
+        self.assertIsNone(kept.archive_segment_id)
+        self.assertEqual(kept.get_content_difference(), content_differences[1])
+
+        for version, (changing, unchanged) in enumerate(self.results[:2]):
+            snapshot = PageSnapshot.objects.get(id=changing.snapshot_id)
+            self.assertIsNotNone(snapshot.archive_segment_id)
+            self.assertIsNone(snapshot.content)
+            snapshot.load_archived()
+            self.assertEqual(snapshot.content, f"python {version}\n")
+            result = Result.objects.select_related("snapshot").get(id=changing.id)
+            self.assertEqual(result.page_content_text, f"python {version}\n")
+        unchanged = PageSnapshot.objects.get(id=self.results[0][1].snapshot_id)
+        self.assertIsNone(unchanged.archive_segment_id)
+        self.assertEqual(unchanged.content, "guide\n")
+
+    def test_archive_twice(self):
+        archive_old_content(older_than_days=0, keep_scrapes=1)
+        stats = archive_old_content(older_than_days=0, keep_scrapes=1)
+        self.assertEqual(stats, {"scrapes": 2, "differences": 0, "snapshots": 0})
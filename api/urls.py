@@ -14,4 +14,5 @@ urlpatterns = [
     path("results/difference/text/<int:id>", views.get_difference_text),
     path("results/difference/as_array/<int:id>", views.get_difference_text_as_arrays),
     path("results/difference/urls", views.get_difference_urls),
+    path("dataforseo/pingback", views.dataforseo_pingback),
 ]
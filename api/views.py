@@ -1,6 +1,8 @@
 import json
+from datetime import datetime, timezone
 from typing import Tuple
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.decorators import method_decorator
 from drf_yasg import openapi
@@ -13,12 +15,13 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from api.models import Difference, Query, Result, Scrape, Status
+from api.models import Difference, Query, Result, Scrape, Status, add_months
+from api.query_urls import get_new_results
 from api.scraper import Scraper
 from api.serializers import (DifferenceSerializer, DifferenceSerializerArray,
                              QuerySerializer, ResultDetailSerializer,
                              ResultListSerializer, ScrapeSerializer)
-from api.tasks import perform_scrape
+from api.tasks import claim_scrape, collect_serp_task, perform_scrape
 
 # Create your views here.
 
@@ -28,12 +31,19 @@ class QueryViewSet(ModelViewSet):
     queryset = Query.objects.all()
 
     def perform_create(self, serializer: QuerySerializer) -> None:
-        query = serializer.save()
+        # the query is scraped right away, and then every interval
+        query = serializer.save(
+            next_run_at=add_months(
+                datetime.now(timezone.utc),
+                serializer.validated_data["interval_no_of_months"],
+            )
+        )
 
         scrape = Scrape(query=query, status=Status.PENDING)
         scrape.save()
 
-        perform_scrape.delay(scrape.id)
+        if claim_scrape(scrape) == scrape:
+            perform_scrape.delay(scrape.id)
 
 
 query_id = openapi.Parameter(
@@ -60,6 +70,12 @@ class ScrapeViewSet(
     def perform_create(self, serializer: ScrapeSerializer) -> None:
         scrape = serializer.save()
 
+        in_flight_scrape = claim_scrape(scrape)
+        if in_flight_scrape != scrape:
+            # respond with the scrape already in flight for the query
+            serializer.instance = in_flight_scrape
+            return
+
         perform_scrape.delay(scrape.id, )
 
     def get_queryset(self):
@@ -95,7 +111,9 @@ class ResultsViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = Result.objects.filter(scrape__id=scrape)
         else:
             queryset = Result.objects.all()
-        return queryset
+        if self.action == "retrieve":
+            return queryset.select_related("snapshot")
+        return queryset.only(*ResultListSerializer.Meta.fields)
 
 
 def get_scrapes_from_params(request: Request) -> Tuple[Scrape, Scrape]:
@@ -126,16 +144,22 @@ def get_scrapes_from_params(request: Request) -> Tuple[Scrape, Scrape]:
     return scrape1, scrape2
 
 
-def get_difference(id: int, as_arrays: bool = False) -> Response:
+def get_difference(request: Request, id: int, as_arrays: bool = False) -> Response:
     try:
-        difference = Difference.objects.get(id=id)
+        difference = Difference.objects.select_related(
+            "result1__snapshot", "result2__snapshot").get(id=id)
     except Difference.DoesNotExist:
         return Response(
             {"status": "error", "message": "Difference with given id does not exist."},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    difference.content_difference = json.loads(difference.content_difference)
+    intraline = request.query_params.get("intraline")
+    if intraline is None:
+        intraline = settings.SCRAPER_DIFF_INTRALINE
+    else:
+        intraline = intraline.lower() == "true"
+    difference.content_difference = difference.get_content_difference(intraline)
     difference.title_difference = json.loads(difference.title_difference)
     if not as_arrays:
         difference.content_difference = "\n".join(
@@ -179,19 +203,17 @@ def get_difference_urls(request: Request) -> Response:
     scrape1, scrape2 = get_scrapes_from_params(request)
 
     urls1 = set(
-        [result.page_link for result in Result.objects.filter(scrape=scrape1, page_scrape_status=Status.SUCCESS)])
+        Result.objects.filter(
+            scrape=scrape1, page_scrape_status=Status.SUCCESS
+        ).values_list("page_link", flat=True)
+    )
     urls2 = set(
-        [result.page_link for result in Result.objects.filter(scrape=scrape2, page_scrape_status=Status.SUCCESS)])
-    all_urls = set(
-        [
-            result.page_link
-            for result in Result.objects.filter(scrape__query=scrape1.query, page_scrape_status=Status.SUCCESS).exclude(
-                scrape=scrape2
-            )
-        ]
+        Result.objects.filter(
+            scrape=scrape2, page_scrape_status=Status.SUCCESS
+        ).values_list("page_link", flat=True)
     )
 
-    unique_urls_added = urls2 - all_urls
+    unique_urls_added = set(get_new_results(scrape2).values_list("page_link", flat=True))
     urls_added = urls2 - urls1 - unique_urls_added
     data = {
         "scrape1": ScrapeSerializer(scrape1).data,
@@ -213,8 +235,12 @@ def get_results_with_difference(request):
 
     scrape1, scrape2 = get_scrapes_from_params(request)
 
-    differences = Difference.objects.filter(
-        result1__scrape=scrape1, result2__scrape=scrape2, has_difference=True
+    differences = (
+        Difference.objects.filter(
+            result1__scrape=scrape1, result2__scrape=scrape2, has_difference=True
+        )
+        .select_related("result2")
+        .only("id", "result2__page_link", "result2__page_title")
     )
 
     data = {
@@ -232,7 +258,20 @@ def get_results_with_difference(request):
     return Response(data, status=status.HTTP_200_OK)
 
 
-@swagger_auto_schema(method="get", responses={200: DifferenceSerializer()})
+intraline = openapi.Parameter(
+    "intraline",
+    openapi.IN_QUERY,
+    description="Whether to mark the changed characters of changed lines with ? lines",
+    type=openapi.TYPE_BOOLEAN,
+    required=False,
+)
+
+
+@swagger_auto_schema(
+    method="get",
+    manual_parameters=[intraline],
+    responses={200: DifferenceSerializer()},
+)
 @api_view(("GET",))
 @renderer_classes((JSONRenderer,))
 def get_difference_text(request, id: int) -> Response:
@@ -240,10 +279,14 @@ def get_difference_text(request, id: int) -> Response:
     Returns a single difference instance for the given id, with the difference as text.
     """
 
-    return get_difference(id, False)
+    return get_difference(request, id, False)
 
 
-@swagger_auto_schema(method="get", responses={200: DifferenceSerializerArray()})
+@swagger_auto_schema(
+    method="get",
+    manual_parameters=[intraline],
+    responses={200: DifferenceSerializerArray()},
+)
 @api_view(("GET",))
 @renderer_classes((JSONRenderer,))
 def get_difference_text_as_arrays(request, id: int) -> Response:
@@ -251,4 +294,24 @@ def get_difference_text_as_arrays(request, id: int) -> Response:
     Returns a single difference instance for the given id, with the difference as arrays.
     """
 
-    return get_difference(id, True)
+    return get_difference(request, id, True)
+
+
+@swagger_auto_schema(method="get", auto_schema=None)
+@api_view(("GET",))
+@renderer_classes((JSONRenderer,))
+def dataforseo_pingback(request: Request) -> Response:
+    """
+    Called by DataForSEO when a posted SERP task is ready.
+    """
+
+    task_id = request.query_params.get("id")
+    tag = request.query_params.get("tag")
+    if not task_id or not tag:
+        raise ValidationError(
+            {"status": "error", "message": "id and tag are required"},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    collect_serp_task.delay(task_id, tag)
+    return Response({"status": "ok"}, status=status.HTTP_200_OK)
@@ -16,7 +16,6 @@ from datetime import timedelta
 from pathlib import Path
 
 import dj_database_url
-from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -148,14 +147,188 @@ CELERY_APP = "serp_checker.celery:app"
 CELERY_BROKER_URL = os.getenv("REDIS_URL")  # Redis URL
 CELERY_RESULT_BACKEND = os.getenv("REDIS_URL")  # Redis URL
 
+# Redis holding the per query scrape leases
+SCRAPE_LOCK_REDIS_URL = os.getenv("SCRAPE_LOCK_REDIS_URL", os.getenv("REDIS_URL"))
+# A scrape lease expires unless renewed within this time, in seconds
+SCRAPE_LOCK_TTL_SECONDS = int(os.getenv("SCRAPE_LOCK_TTL_SECONDS", 30 * 60))
+
+# Pending scrapes without progress for this long are requeued to resume, in
+# seconds. It must outlast the slowest page, and the queueing of page tasks.
+SCRAPE_HEARTBEAT_TIMEOUT_SECONDS = int(
+    os.getenv("SCRAPE_HEARTBEAT_TIMEOUT_SECONDS", 30 * 60))
+# Stale scrapes are failed instead of requeued once attempted this many times
+SCRAPE_MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", 3))
+
+# Scheduled scrapes are enqueued spread evenly over this window, in seconds
+SCRAPE_DISPATCH_WINDOW_SECONDS = int(
+    os.getenv("SCRAPE_DISPATCH_WINDOW_SECONDS", 6 * 60 * 60))
+# Max rate at which each worker starts scrapes, e.g. "10/m"
+SCRAPE_RATE_LIMIT = os.getenv("SCRAPE_RATE_LIMIT", "10/m")
+# Redis redelivers tasks not acknowledged within the visibility timeout, and
+# tasks waiting on a countdown are not acknowledged, so it must outlast the
+# dispatch window
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "visibility_timeout": SCRAPE_DISPATCH_WINDOW_SECONDS + 60 * 60,
+}
+
+# Page tasks go to the "http" queue, or to the "browser" queue for pages of
+# sites scraped with a browser. Everything else stays on the default queue.
+CELERY_TASK_ROUTES = {
+    "api.tasks.scrape_page": {"queue": "http"},
+}
+
+# Pool, concurrency and prefetch of the worker of each queue. A worker picks
+# its profile from the CELERY_WORKER_PROFILE environment variable.
+CELERY_WORKER_PROFILES = {
+    "default": {
+        "pool": "prefork",
+        "concurrency": int(os.getenv("DEFAULT_WORKER_CONCURRENCY", 2)),
+        "prefetch_multiplier": int(os.getenv("DEFAULT_WORKER_PREFETCH", 1)),
+        # diffs the pages of finished scrapes
+        "compute_processes": int(os.getenv("DEFAULT_WORKER_COMPUTE_PROCESSES", 2)),
+    },
+    # light, I/O bound page fetches
+    "http": {
+        "pool": "threads",
+        "concurrency": int(os.getenv("HTTP_WORKER_CONCURRENCY", 32)),
+        "prefetch_multiplier": int(os.getenv("HTTP_WORKER_PREFETCH", 4)),
+        # extracts the text of fetched pages
+        "compute_processes": int(
+            os.getenv("HTTP_WORKER_COMPUTE_PROCESSES", os.cpu_count() or 1)),
+    },
+    # memory heavy, slow browser fetches
+    "browser": {
+        "pool": "prefork",
+        "concurrency": int(os.getenv("BROWSER_WORKER_CONCURRENCY", 2)),
+        "prefetch_multiplier": int(os.getenv("BROWSER_WORKER_PREFETCH", 1)),
+        "compute_processes": int(os.getenv("BROWSER_WORKER_COMPUTE_PROCESSES", 0)),
+    },
+}
+_worker_profile = CELERY_WORKER_PROFILES[os.getenv("CELERY_WORKER_PROFILE", "default")]
+CELERY_WORKER_POOL = _worker_profile["pool"]
+CELERY_WORKER_CONCURRENCY = _worker_profile["concurrency"]
+CELERY_WORKER_PREFETCH_MULTIPLIER = _worker_profile["prefetch_multiplier"]
+
+# DataForSEO Configuration
+
+DFS_API_URL = os.getenv("DFS_API_URL", "https://api.dataforseo.com")
+DFS_EMAIL = os.getenv("DFS_EMAIL")
+DFS_PASSWORD = os.getenv("DFS_PASSWORD")
+# Post the SERPs of scheduled scrapes as batched tasks instead of live requests
+DFS_BATCH_MODE = os.getenv("DFS_BATCH_MODE", "false").lower() == "true"
+# Public url of the pingback view, e.g. https://example.com/api/dataforseo/pingback
+# Without it, ready tasks are polled for every minute
+DFS_PINGBACK_URL = os.getenv("DFS_PINGBACK_URL")
+
+# SERP responses are reused for requests made the same day within this TTL
+SERP_CACHE_TTL_SECONDS = int(os.getenv("SERP_CACHE_TTL_SECONDS", 24 * 60 * 60))
+# Reuse the latest cached SERP of a request whatever its age, to avoid paying
+# for API calls in development
+SERP_CACHE_ANY_DATE = (
+    os.getenv("SERP_CACHE_ANY_DATE", str(os.getenv("ENVIRON") == "dev")).lower()
+    == "true"
+)
+
 # Celery Beat Configuration (for scheduling)
 CELERY_BEAT_SCHEDULE = {
     "scrape-queries-task": {
         "task": "api.tasks.scrape_queries",  # Task to be executed
-        # Schedule interval (e.g., 30 days)
-        "schedule": crontab(0, 0, day_of_month="1")
-        # 'schedule': timedelta(minutes=2)
+        # Picks up the queries that are due since the last run
+        "schedule": timedelta(
+            minutes=int(os.getenv("SCRAPE_SCHEDULER_INTERVAL_MINUTES", 5))
+        ),
+    },
+    "reap-stale-scrapes-task": {
+        "task": "api.tasks.reap_stale_scrapes",
+        "schedule": timedelta(minutes=5),
     },
+    "archive-old-content-task": {
+        "task": "api.tasks.archive_old_content",
+        "schedule": timedelta(days=1),
+    },
+}
+if DFS_BATCH_MODE:
+    # also catches tasks whose pingback was missed
+    CELERY_BEAT_SCHEDULE["collect-serp-tasks-task"] = {
+        "task": "api.tasks.collect_serp_tasks",
+        "schedule": timedelta(minutes=1 if not DFS_PINGBACK_URL else 15),
+    }
+
+# Scraper Configuration
+
+# Scrape each page in a task of its own, spread across all workers, instead
+# of fetching all pages of a scrape within a single task. Page tasks aren't
+# bound by the concurrency limits and deadline below, and don't log the
+# connection reuse of the scrape, so this is off unless the scrapes need more
+# than one worker.
+SCRAPER_FAN_OUT = os.getenv("SCRAPER_FAN_OUT", "false").lower() == "true"
+# Max number of pages fetched in parallel for a scrape
+SCRAPER_MAX_CONCURRENCY = int(os.getenv("SCRAPER_MAX_CONCURRENCY", 16))
+# Max number of pages fetched in parallel from the same host
+SCRAPER_PER_HOST_CONCURRENCY = int(os.getenv("SCRAPER_PER_HOST_CONCURRENCY", 2))
+# Time allowed for fetching all the pages of a scrape, in seconds
+SCRAPER_DEADLINE_SECONDS = int(os.getenv("SCRAPER_DEADLINE_SECONDS", 600))
+
+# Number of rows written per insert. Results are saved in batches of this size
+# as their pages are fetched, so it is also the granularity of checkpoints.
+SCRAPER_BATCH_SIZE = int(os.getenv("SCRAPER_BATCH_SIZE", 20))
+
+# Backend used to extract the text of html pages, "lxml" or "bs4"
+SCRAPER_TEXT_EXTRACTOR = os.getenv("SCRAPER_TEXT_EXTRACTOR", "lxml")
+# Pages larger than this are skipped, in bytes
+SCRAPER_MAX_PAGE_BYTES = int(os.getenv("SCRAPER_MAX_PAGE_BYTES", 5 * 1024 * 1024))
+# Engine used to diff the content of pages, "patience" or "differ"
+SCRAPER_DIFF_ENGINE = os.getenv("SCRAPER_DIFF_ENGINE", "patience")
+# Only flag the pages whose content changed when a scrape finishes, and diff
+# their content when the difference is first requested
+SCRAPER_LAZY_DIFFERENCES = (
+    os.getenv("SCRAPER_LAZY_DIFFERENCES", "false").lower() == "true"
+)
+# Show the "?" intraline hints of changed lines in content differences, unless
+# asked otherwise with the intraline parameter of the difference views
+SCRAPER_DIFF_INTRALINE = os.getenv("SCRAPER_DIFF_INTRALINE", "false").lower() == "true"
+# Number of processes the CPU bound work of scrapes runs on, 0 to run it inline
+SCRAPER_COMPUTE_PROCESSES = _worker_profile["compute_processes"]
+# Max number of calls queued or running on the compute processes at once
+SCRAPER_COMPUTE_MAX_PENDING = int(
+    os.getenv("SCRAPER_COMPUTE_MAX_PENDING", 2 * max(SCRAPER_COMPUTE_PROCESSES, 1)))
+# Number of browsers kept running by each worker process
+SCRAPER_BROWSER_POOL_SIZE = int(os.getenv("SCRAPER_BROWSER_POOL_SIZE", 2))
+# Number of pages a browser loads before it is restarted
+SCRAPER_BROWSER_MAX_PAGES = int(os.getenv("SCRAPER_BROWSER_MAX_PAGES", 50))
+# Time to wait for the content of a page to render in the browser, in seconds
+SCRAPER_BROWSER_WAIT_SECONDS = int(os.getenv("SCRAPER_BROWSER_WAIT_SECONDS", 10))
+
+# Codec the compressed text columns are written with, "zlib", "bz2", "lzma" or
+# "none". Values written with another codec can still be read.
+COMPRESSED_FIELD_CODEC = os.getenv("COMPRESSED_FIELD_CODEC", "zlib")
+# Compression level of the codec, from 0 (fastest) to 9 (smallest)
+COMPRESSED_FIELD_LEVEL = int(os.getenv("COMPRESSED_FIELD_LEVEL", 6))
+
+# Directory the content of old scrapes is archived to
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", BASE_DIR / "archive")
+# Content of scrapes older than this is archived, in days
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+# Number of latest scrapes of each query whose content is never archived
+ARCHIVE_KEEP_SCRAPES = int(os.getenv("ARCHIVE_KEEP_SCRAPES", 3))
+# Size archive segments are rolled over at, in bytes
+ARCHIVE_SEGMENT_MAX_BYTES = int(
+    os.getenv("ARCHIVE_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+# Number of archived records each process keeps in memory once read
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", 128))
+
+# Number of hosts the HTTP client keeps a connection pool for
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 100))
+# Number of kept-alive connections per host
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", SCRAPER_PER_HOST_CONCURRENCY))
+# Pool sizes for specific hosts, e.g. "api.dataforseo.com=8,www.example.com=4"
+HTTP_HOST_POOL_SIZES = {
+    host.strip(): int(size)
+    for host, size in (
+        item.split("=")
+        for item in os.getenv("HTTP_HOST_POOL_SIZES", "api.dataforseo.com=8").split(",")
+        if item.strip()
+    )
 }
 
 STORAGES = {